@@ -0,0 +1,128 @@
+"""
+Load benchmark for concurrent /chat requests against a stub LLM server.
+
+Runs the real FastAPI app under uvicorn with OpenAI calls pointed at
+benchmarks.stub_llm, uploads a synthetic log and fires batches of
+concurrent /chat requests. Reports p50/p99 latency per concurrency level,
+plus the latency of /status probes sent while the chats are in flight
+(a blocked event loop shows up there first).
+
+    cd chatbot_backend
+    python -m benchmarks.bench_chat_load --concurrency 1 8 32
+"""
+import argparse
+import os
+import socket
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from benchmarks.stub_llm import start_stub_server
+from benchmarks.synthetic_log import write_log
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_backend():
+    import uvicorn
+
+    # keep the per-request log lines out of the results table
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    import main
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def upload(base_url, path):
+    with open(path, "rb") as f:
+        session = requests.post(f"{base_url}/upload", files={"file": ("bench.bin", f)}).json()["sessionNum"]
+    while not requests.get(f"{base_url}/status/{session}").json()["done"]:
+        time.sleep(0.1)
+    return session
+
+
+def timed_post(url, data):
+    start = time.perf_counter()
+    response = requests.post(url, data=data)
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+def probe_status(base_url, session, stop, samples):
+    while not stop.is_set():
+        start = time.perf_counter()
+        requests.get(f"{base_url}/status/{session}")
+        samples.append(time.perf_counter() - start)
+        time.sleep(0.02)
+
+
+def run_level(base_url, session, concurrency, rounds):
+    latencies, probes = [], []
+    stop = threading.Event()
+    prober = threading.Thread(target=probe_status, args=(base_url, session, stop, probes))
+    prober.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [
+            pool.submit(timed_post, f"{base_url}/chat", {"sessionNum": session, "query": f"Any GPS issues? #{i}"})
+            for i in range(concurrency * rounds)
+        ]
+        latencies = [f.result() for f in futures]
+    wall = time.perf_counter() - start
+    stop.set()
+    prober.join()
+    return latencies, probes, wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--rounds", type=int, default=3, help="requests per client at each level")
+    parser.add_argument("--chat-latency", type=float, default=0.5, help="stub completion latency (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="stub embedding latency (s)")
+    parser.add_argument("--duration", type=float, default=600.0, help="synthetic flight length (s)")
+    args = parser.parse_args()
+
+    _, stub_url = start_stub_server(args.embed_latency, args.chat_latency)
+    os.environ["OPENAI_API_BASE"] = stub_url
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    import openai
+    openai.api_base = stub_url
+    openai.api_key = os.environ["OPENAI_API_KEY"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # fresh embedding and answer caches, so every run starts cold
+        os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(tmp, "embeddings.sqlite")
+        os.environ["ANSWER_CACHE_PATH"] = os.path.join(tmp, "answers.sqlite")
+        _, base_url = start_backend()
+        path = os.path.join(tmp, "bench.bin")
+        write_log(path, args.duration)
+        session = upload(base_url, path)
+        # first chat builds the vector store, keep it out of the numbers
+        timed_post(f"{base_url}/chat", {"sessionNum": session, "query": "warm up"})
+
+        print(f"stub latency: chat {args.chat_latency * 1000:.0f} ms, embed {args.embed_latency * 1000:.0f} ms")
+        print(f"{'clients':>8} {'requests':>9} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>8} {'status p99 ms':>14}")
+        for concurrency in args.concurrency:
+            latencies, probes, wall = run_level(base_url, session, concurrency, args.rounds)
+            lat = np.array(latencies) * 1000
+            probe = np.array(probes or [0.0]) * 1000
+            print(f"{concurrency:>8} {len(lat):>9} {np.percentile(lat, 50):>9.1f} {np.percentile(lat, 99):>9.1f} "
+                  f"{len(lat) / wall:>8.1f} {np.percentile(probe, 99):>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Throughput benchmark for the fleet batch analyzer.
+
+Runs fleet.analyze_fleet over a directory of logs at several worker
+counts and prints logs/min and MB/s for each. By default it uses the
+ArduPilot test logs that UAVLogViewer/test/testlogfiles/logdownloader.sh
+downloads to /tmp/testlogs; if that directory has no .bin logs, it
+writes --count synthetic logs to a temporary directory instead.
+
+    cd chatbot_backend
+    python -m benchmarks.bench_fleet --workers 1 2 4
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from benchmarks.synthetic_log import write_log
+from fleet import analyze_fleet, find_logs
+
+TEST_LOG_DIR = "/tmp/testlogs"
+
+
+def synthetic_fleet(root, count, duration_s):
+    for i in range(count):
+        # a different seed per log, so no two logs share a content hash
+        write_log(os.path.join(root, f"flight-{i:03d}.bin"), duration_s, seed=i)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logs", default=TEST_LOG_DIR, help="directory of .bin logs")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--count", type=int, default=16, help="synthetic logs written if --logs has none")
+    parser.add_argument("--duration", type=float, default=600.0, help="synthetic flight length (s)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = args.logs
+        if not find_logs(root):
+            print(f"no .bin logs in {root}, writing {args.count} synthetic logs")
+            root = tmp
+            synthetic_fleet(root, args.count, args.duration)
+        paths = find_logs(root)
+        total_mb = sum(os.path.getsize(p) for p in paths) / 1e6
+        print(f"{len(paths)} logs, {total_mb:.1f} MB in {root}")
+        print(f"{'workers':>8} {'seconds':>9} {'logs/min':>10} {'MB/s':>8} {'errors':>7}")
+        for workers in args.workers:
+            start = time.perf_counter()
+            # no index: every run analyses every log
+            rows = analyze_fleet(root, workers)
+            elapsed = time.perf_counter() - start
+            errors = sum(1 for r in rows if r["status"] == "error")
+            print(f"{workers:>8} {elapsed:>9.2f} {len(rows) / elapsed * 60:>10.1f} "
+                  f"{total_mb / elapsed:>8.2f} {errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
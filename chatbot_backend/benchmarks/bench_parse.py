@@ -0,0 +1,94 @@
+"""
+Parse benchmark: full pymavlink decode against the lazy offset index.
+
+For each log, times the full decode (parse_log_columns), the index scan
+alone, the scan plus risk scoring (what an upload waits for before it is
+ready) and decoding every field from the index afterwards. With --verify
+the decoded columns are checked against the full decode, and any
+difference makes it exit non-zero. Uses the logs in /tmp/testlogs, or a
+synthetic log if there are none.
+
+    cd chatbot_backend
+    python -m benchmarks.bench_parse --verify
+"""
+import argparse
+import contextlib
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_log import write_log
+from chat.agent import compute_flight_risk
+from fleet import find_logs
+from telemetry_parser.log_index import index_log_file, is_dataflash
+from telemetry_parser.mavlog_parser import parse_log_columns
+
+TEST_LOG_DIR = "/tmp/testlogs"
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def decode_all(parsed):
+    for fields in parsed["columns"].values():
+        for _ in fields.values():
+            pass
+
+
+def mismatches(full, lazy):
+    problems = []
+    for msg_type, fields in full["columns"].items():
+        if msg_type not in lazy["columns"]:
+            problems.append(f"{msg_type} missing")
+            continue
+        for field, expected in fields.items():
+            actual = lazy["columns"][msg_type].get(field)
+            if actual is None or actual.dtype != expected.dtype or not np.array_equal(
+                    actual, expected, equal_nan=expected.dtype.kind == "f"):
+                problems.append(f"{msg_type}.{field}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logs", default=TEST_LOG_DIR, help="directory of .bin logs")
+    parser.add_argument("--duration", type=float, default=600.0, help="synthetic flight length (s)")
+    parser.add_argument("--verify", action="store_true", help="compare every decoded column with the full decode")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = [p for p in find_logs(args.logs) if is_dataflash(p)]
+        if not paths:
+            print(f"no DataFlash logs in {args.logs}, using a synthetic log")
+            paths = [os.path.join(tmp, "synthetic.bin")]
+            write_log(paths[0], args.duration)
+
+        print(f"{'log':<24} {'MB':>6} {'full s':>8} {'index s':>8} {'+risk s':>8} {'decode s':>9} {'speedup':>8}")
+        for path in paths:
+            # pymavlink reports skipped bytes on stdout
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                full, full_s = timed(parse_log_columns, path)
+            lazy, index_s = timed(index_log_file, path)
+            _, risk_s = timed(compute_flight_risk, lazy)
+            _, decode_s = timed(decode_all, lazy)
+            ready_s = index_s + risk_s
+            print(f"{os.path.basename(path)[:24]:<24} {os.path.getsize(path) / 1e6:>6.1f} {full_s:>8.2f} "
+                  f"{index_s:>8.3f} {ready_s:>8.3f} {decode_s:>9.3f} {full_s / ready_s:>7.1f}x")
+            if args.verify:
+                problems = mismatches(full, lazy)
+                failed = failed or bool(problems)
+                print("  columns match the full decode" if not problems
+                      else f"  {len(problems)} columns differ: {', '.join(problems[:10])}")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
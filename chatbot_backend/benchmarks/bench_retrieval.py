@@ -0,0 +1,105 @@
+"""
+Recall versus latency of chunk retrieval on synthetic large sessions.
+
+Builds sessions of --chunks chunks whose vectors are clustered by
+message type and drift slowly over flight time, like real chunk
+embeddings, then times queries against the exhaustive inner-product
+index (the ground truth) and against HNSW at several efSearch values,
+reporting recall@k for each. Filtered searches (one message type, one
+time range) are timed too.
+
+    cd chatbot_backend
+    python -m benchmarks.bench_retrieval --chunks 2000 20000 --ef 16 32 64 128
+"""
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from chat.retrieval import HNSW_EF_CONSTRUCTION, HNSW_M, matching_chunks, normalized, search
+
+MSG_TYPES = ["ATT", "BAT", "BARO", "CTUN", "GPS", "IMU", "MAG", "RCIN", "RCOU", "VIBE"]
+WINDOW_US = 60_000_000
+
+
+def synthetic_session(n_chunks, dim, noise=0.3, seed=0):
+    """Normalised chunk vectors plus (msgType, startUs, endUs) arrays."""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((len(MSG_TYPES), dim)).astype(np.float32)
+    drift = rng.standard_normal((len(MSG_TYPES), dim)).astype(np.float32)
+    type_ids = np.arange(n_chunks) % len(MSG_TYPES)
+    windows = np.arange(n_chunks) // len(MSG_TYPES)
+    phase = (windows / max(windows.max(), 1))[:, None].astype(np.float32)
+    vectors = (centroids[type_ids] + phase * drift[type_ids]
+               + noise * rng.standard_normal((n_chunks, dim)).astype(np.float32))
+    starts = windows.astype(np.int64) * WINDOW_US
+    return normalized(vectors), np.array(MSG_TYPES)[type_ids], starts, starts + WINDOW_US - 1
+
+
+def queries_for(vectors, n_queries, seed=1):
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.integers(0, len(vectors), n_queries)]
+    return normalized(picks + 0.05 * rng.standard_normal(picks.shape).astype(np.float32))
+
+
+def timed_searches(index, queries, k, ids=None):
+    found, start = [], time.perf_counter()
+    for q in queries:
+        found.append(search(index, q, k, ids)[1])
+    return found, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def recall(found, truth, k):
+    return np.mean([len(set(f[:k]) & set(t[:k])) / k for f, t in zip(found, truth)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, nargs="+", default=[2000, 20000])
+    parser.add_argument("--dim", type=int, default=1536)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=8)
+    parser.add_argument("--ef", type=int, nargs="+", default=[16, 32, 64, 128], help="HNSW efSearch values")
+    parser.add_argument("--noise", type=float, default=0.3, help="per-chunk noise around its type's cluster")
+    args = parser.parse_args()
+    faiss.omp_set_num_threads(1)
+
+    print(f"{'chunks':>7} {'index':<14} {'build s':>8} {'ms/query':>9} {'recall@' + str(args.k):>9}")
+    for n in args.chunks:
+        vectors, types, starts, ends = synthetic_session(n, args.dim, args.noise)
+        queries = queries_for(vectors, args.queries)
+
+        start = time.perf_counter()
+        flat = faiss.IndexFlatIP(args.dim)
+        flat.add(vectors)
+        flat_build = time.perf_counter() - start
+        truth, flat_ms = timed_searches(flat, queries, args.k)
+        print(f"{n:>7} {'flat':<14} {flat_build:>8.2f} {flat_ms:>9.3f} {1.0:>9.3f}")
+
+        start = time.perf_counter()
+        hnsw = faiss.IndexHNSWFlat(args.dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        hnsw.add(vectors)
+        hnsw_build = time.perf_counter() - start
+        for ef in args.ef:
+            params = faiss.SearchParametersHNSW(efSearch=ef)
+            start = time.perf_counter()
+            found = [hnsw.search(q[None, :], args.k, params=params)[1][0] for q in queries]
+            ms = (time.perf_counter() - start) / len(queries) * 1000
+            print(f"{n:>7} {f'hnsw ef={ef}':<14} {hnsw_build:>8.2f} {ms:>9.3f} {recall(found, truth, args.k):>9.3f}")
+
+        # one message type, and one message type within a 10-minute span
+        for label, ids in (
+            ("type filter", matching_chunks(types, starts, ends, {"BAT"})),
+            ("type+time", matching_chunks(types, starts, ends, {"BAT"}, (starts[n // 2], starts[n // 2] + 600 * 10**6))),
+        ):
+            exact = [ids[np.argsort(-(vectors[ids] @ q), kind="stable")[:args.k]] for q in queries]
+            for name, index in (("flat", flat), ("hnsw", hnsw)):
+                found, ms = timed_searches(index, queries, args.k, ids)
+                print(f"{n:>7} {f'{name} {label}':<14} {'':>8} {ms:>9.3f} {recall(found, exact, args.k):>9.3f}"
+                      f"  ({len(ids)} chunks)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Throughput benchmark for the vectorized risk engine.
+
+Scores a synthetic full-resolution flight (every logging rate multiplied
+by --scale) held as parsed columns, so only the detectors are timed, not
+the parse. Prints samples scored, best-of-N time and samples per second,
+plus the per-detector breakdown.
+
+    cd chatbot_backend
+    python -m benchmarks.bench_risk --scale 100
+"""
+import argparse
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_log import flight_profile
+from chat.risk_engine import DETECTORS, score_flight
+
+
+def synthetic_columns(duration_s, scale):
+    """flight_profile() with scalar fields broadcast, shaped like parse_log_columns output."""
+    columns = {}
+    for msg_type, fields in flight_profile(duration_s, scale).items():
+        n = len(fields["TimeUS"])
+        columns[msg_type] = {
+            field: np.broadcast_to(np.asarray(values), (n,) + np.shape(values)[1:]).copy()
+            for field, values in fields.items()
+        }
+    summary = {msg_type: len(fields["TimeUS"]) for msg_type, fields in columns.items()}
+    return {"columns": columns, "summary": summary}
+
+
+def best_of(repeats, fn, *args):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--duration", type=float, default=600.0, help="flight length in seconds")
+    parser.add_argument("--scale", type=int, default=100, help="multiply every logging rate")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    parsed = synthetic_columns(args.duration, args.scale)
+    samples = sum(parsed["summary"].values())
+    elapsed, risk = best_of(args.repeats, score_flight, parsed)
+
+    print(f"{samples:,} samples scored in {elapsed * 1000:.1f} ms "
+          f"({samples / elapsed / 1e6:.1f} M samples/s)")
+    print(f"score {risk['score']} ({risk['riskLevel']})")
+    for det in DETECTORS:
+        det_elapsed, _ = best_of(args.repeats, score_flight, parsed, [det])
+        fired = next((f for f in risk["findings"] if f["detector"] == det["name"]), None)
+        windows = fired["count"] if fired else 0
+        print(f"  {det['name']:<22}{det_elapsed * 1000:8.1f} ms  {windows} window(s)")
+
+
+if __name__ == "__main__":
+    main()
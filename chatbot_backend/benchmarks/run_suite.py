@@ -0,0 +1,239 @@
+"""
+Repeatable regression suite: parse throughput and end-to-end latency.
+
+Checks that the offset index decodes a synthetic log exactly as the full
+pymavlink decode does, parses every bundled test log in-process (MB/s,
+messages/s), scores it with the risk engine, then runs the real app against benchmarks.stub_llm
+and times upload-to-parsed, the first chat (vector store build), warm
+chats, fast-path answers, answer cache hits and time to the first
+streamed token. The
+/metrics stage breakdown is printed at the end.
+
+Logs come from /tmp/testlogs (see UAVLogViewer/test/testlogfiles/
+logdownloader.sh) or, if it has none, a synthetic log. Results can be
+written with --output and compared against an earlier run with
+--baseline; a decode mismatch, or a metric more than --tolerance worse
+than the baseline, makes the suite exit non-zero.
+
+    cd chatbot_backend
+    python -m benchmarks.run_suite --output bench.json
+    python -m benchmarks.run_suite --baseline bench.json --tolerance 0.25
+"""
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import requests
+
+from benchmarks.bench_chat_load import start_backend, upload
+from benchmarks.bench_parse import mismatches
+from benchmarks.stub_llm import start_stub_server
+from benchmarks.synthetic_log import write_log
+
+TEST_LOG_DIR = "/tmp/testlogs"
+
+# flight length of the synthetic log the index decode is checked on
+VERIFY_DURATION = 120.0
+
+# metric => True if higher is better
+DIRECTIONS = {
+    "parseMBps": True,
+    "parseMsgsPerSec": True,
+    "riskMs": False,
+    "uploadToParsedMs": False,
+    "firstChatMs": False,
+    "chatP50Ms": False,
+    "fastPathP50Ms": False,
+    "cachedChatP50Ms": False,
+    "streamFirstTokenMs": False,
+}
+
+
+def verify_decode(path):
+    """Columns of the offset index that differ from parse_log_columns on one log."""
+    from telemetry_parser.log_index import index_log_file
+    from telemetry_parser.mavlog_parser import parse_log_columns
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        full = parse_log_columns(path)
+    return mismatches(full, index_log_file(path))
+
+
+def bench_parse(paths, repeat):
+    """Best-of-repeat in-process parse and risk scoring over all logs."""
+    from chat.agent import compute_flight_risk
+    from telemetry_parser.mavlog_parser import parse_log_file
+
+    total_bytes = sum(os.path.getsize(p) for p in paths)
+    parse_s = risk_s = float("inf")
+    for _ in range(repeat):
+        messages, parse_total, risk_total = 0, 0.0, 0.0
+        for path in paths:
+            start = time.perf_counter()
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                parsed = parse_log_file(path, columnar=True)
+            parse_total += time.perf_counter() - start
+            messages += sum(parsed["summary"].values())
+            start = time.perf_counter()
+            compute_flight_risk(parsed)
+            risk_total += time.perf_counter() - start
+        parse_s, risk_s = min(parse_s, parse_total), min(risk_s, risk_total)
+    return {
+        "parseMBps": total_bytes / 1e6 / parse_s,
+        "parseMsgsPerSec": messages / parse_s,
+        "riskMs": risk_s * 1000,
+    }
+
+
+def _post(url, data):
+    start = time.perf_counter()
+    response = requests.post(url, data=data)
+    response.raise_for_status()
+    return (time.perf_counter() - start) * 1000, response.json()
+
+
+def first_token_ms(base_url, session, query):
+    start = time.perf_counter()
+    with requests.post(f"{base_url}/chat/stream", data={"sessionNum": session, "query": query},
+                       stream=True) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if line.startswith(b"event: token"):
+                elapsed = (time.perf_counter() - start) * 1000
+                # drain the rest so the exchange completes normally
+                for _ in response.iter_lines():
+                    pass
+                return elapsed
+    raise RuntimeError("stream ended without a token")
+
+
+def bench_end_to_end(path, chats):
+    _, base_url = start_backend()
+
+    start = time.perf_counter()
+    session = upload(base_url, path)
+    upload_ms = (time.perf_counter() - start) * 1000
+
+    first_ms, _ = _post(f"{base_url}/chat", {"sessionNum": session, "query": "Summarise the flight"})
+    chat_ms = [_post(f"{base_url}/chat", {"sessionNum": session, "query": f"Any GPS issues? #{i}"})[0]
+               for i in range(chats)]
+    fast = [_post(f"{base_url}/chat", {"sessionNum": session, "query": "What was the maximum altitude?"})
+            for _ in range(chats)]
+    fast_ms = [ms for ms, _ in fast]
+    if not all(body.get("fastPath") for _, body in fast):
+        print("warning: the fast-path query went to the LLM", file=sys.stderr)
+    stream_ms = [first_token_ms(base_url, session, f"Explain the battery behaviour #{i}") for i in range(chats)]
+
+    # the opening question again from new sessions on the same log
+    cached = [_post(f"{base_url}/chat", {"sessionNum": upload(base_url, path), "query": "Summarise the flight"})
+              for _ in range(chats)]
+    if not all(body.get("cached") for _, body in cached):
+        print("warning: a repeated question was not answered from the cache", file=sys.stderr)
+
+    return {
+        "uploadToParsedMs": upload_ms,
+        "firstChatMs": first_ms,
+        "chatP50Ms": statistics.median(chat_ms),
+        "fastPathP50Ms": statistics.median(fast_ms),
+        "streamFirstTokenMs": statistics.median(stream_ms),
+        "cachedChatP50Ms": statistics.median(ms for ms, _ in cached),
+    }
+
+
+def print_stages():
+    from metrics import metrics
+
+    snapshot = metrics.snapshot()
+    print(f"\n{'stage':<20} {'count':>7} {'total ms':>10} {'mean ms':>9}")
+    for stage, s in sorted(snapshot["stages"].items()):
+        print(f"{stage:<20} {s['count']:>7} {s['sum'] * 1000:>10.1f} {s['sum'] * 1000 / s['count']:>9.2f}")
+    print()
+    for name, value in sorted(snapshot["counters"].items()):
+        print(f"{name:<28} {value:>14,.0f}")
+
+
+def regressions(results, baseline, tolerance):
+    failed = []
+    for name, higher_is_better in DIRECTIONS.items():
+        old, new = baseline.get(name), results.get(name)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (-change if higher_is_better else change) > tolerance:
+            failed.append(f"{name}: {old:.1f} -> {new:.1f} ({change:+.0%})")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logs", default=TEST_LOG_DIR, help="directory of .bin logs")
+    parser.add_argument("--duration", type=float, default=600.0, help="synthetic flight length (s)")
+    parser.add_argument("--repeat", type=int, default=3, help="parse passes, the best is kept")
+    parser.add_argument("--chats", type=int, default=5, help="requests per chat latency measurement")
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="stub completion latency (s)")
+    parser.add_argument("--embed-latency", type=float, default=0.02, help="stub embedding latency (s)")
+    parser.add_argument("--output", help="write results as JSON")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    _, stub_url = start_stub_server(args.embed_latency, args.chat_latency)
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    import openai
+    openai.api_base = stub_url
+    openai.api_key = os.environ["OPENAI_API_KEY"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # cold embedding and answer caches and log store, so every run does the same work
+        os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(tmp, "embeddings.sqlite")
+        os.environ["LOG_STORE_PATH"] = os.path.join(tmp, "logs")
+        os.environ["ANSWER_CACHE_PATH"] = os.path.join(tmp, "answers.sqlite")
+        # imported only now: the app modules read these paths at import time
+        from fleet import find_logs
+
+        paths = find_logs(args.logs)
+        if not paths:
+            print(f"no .bin logs in {args.logs}, using a synthetic log")
+            paths = [os.path.join(tmp, "synthetic.bin")]
+            write_log(paths[0], args.duration)
+        total_mb = sum(os.path.getsize(p) for p in paths) / 1e6
+        print(f"{len(paths)} logs, {total_mb:.1f} MB; stub latency chat {args.chat_latency * 1000:.0f} ms, "
+              f"embed {args.embed_latency * 1000:.0f} ms")
+
+        verify_path = os.path.join(tmp, "verify.bin")
+        write_log(verify_path, VERIFY_DURATION)
+        problems = verify_decode(verify_path)
+        if problems:
+            print(f"index decode differs from the full decode: {', '.join(problems[:10])}")
+            sys.exit(1)
+        print("index decode matches the full decode on a synthetic log")
+
+        results = bench_parse(paths, args.repeat)
+        # end to end on the largest log
+        end_to_end = bench_end_to_end(max(paths, key=os.path.getsize), args.chats)
+        results.update(end_to_end)
+
+    print()
+    for name, value in results.items():
+        print(f"{name:<22} {value:>14,.1f}")
+    print_stages()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            failed = regressions(results, json.load(f), args.tolerance)
+        if failed:
+            print("\nregressions beyond tolerance:\n  " + "\n  ".join(failed))
+            sys.exit(1)
+        print(f"\nno regressions beyond {args.tolerance:.0%} of {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
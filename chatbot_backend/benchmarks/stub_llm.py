@@ -0,0 +1,111 @@
+"""
+Minimal stand-in for the OpenAI HTTP API used by the benchmarks.
+
+Serves /v1/embeddings and /v1/chat/completions with a fixed artificial
+latency so load tests measure the backend, not the network. Streaming
+completions (stream=true) spread STREAM_TOKENS tokens evenly over the
+same latency and count streams the client hung up on.
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+EMBEDDING_DIM = 1536
+STREAM_TOKENS = 50
+ANSWER = "1. BRIEF SUMMARY\nStub answer."
+
+
+def fake_embedding(text):
+    seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+    vec = np.random.default_rng(seed).standard_normal(EMBEDDING_DIM)
+    return (vec / np.linalg.norm(vec)).tolist()
+
+
+def stub_usage(messages):
+    # about 4 characters per token, like chat.chunker.estimate_tokens
+    prompt = sum(len(m.get("content") or "") for m in messages) // 4
+    completion = len(ANSWER) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    embed_latency = 0.05
+    chat_latency = 0.5
+    requests_served = 0
+    streams_cancelled = 0
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, body):
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).requests_served += 1
+        if self.path.endswith("/embeddings"):
+            time.sleep(self.embed_latency)
+            inputs = payload["input"]
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            self._reply({
+                "object": "list",
+                "data": [{"object": "embedding", "index": i, "embedding": fake_embedding(t)}
+                         for i, t in enumerate(inputs)],
+                "model": payload.get("model"),
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            })
+        elif self.path.endswith("/chat/completions") and payload.get("stream"):
+            self._stream(payload)
+        elif self.path.endswith("/chat/completions"):
+            time.sleep(self.chat_latency)
+            self._reply({
+                "id": "stub", "object": "chat.completion", "model": payload.get("model"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": ANSWER}}],
+                "usage": stub_usage(payload["messages"]),
+            })
+        else:
+            self.send_error(404)
+
+    def _stream(self, payload):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        tokens = [ANSWER] + [f" token{i}" for i in range(1, STREAM_TOKENS)]
+        try:
+            for token in tokens:
+                time.sleep(self.chat_latency / STREAM_TOKENS)
+                chunk = {"id": "stub", "object": "chat.completion.chunk", "model": payload.get("model"),
+                         "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            type(self).streams_cancelled += 1
+
+
+def start_stub_server(embed_latency=0.05, chat_latency=0.5, port=0):
+    """Start the stub in a daemon thread and return (server, base_url)."""
+    StubHandler.embed_latency = embed_latency
+    StubHandler.chat_latency = chat_latency
+    server = ThreadingHTTPServer(("127.0.0.1", port), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    server, url = start_stub_server(port=8001)
+    print(f"stub OpenAI API at {url} (export OPENAI_API_BASE={url})")
+    threading.Event().wait()
@@ -0,0 +1,194 @@
+"""
+Write synthetic ArduPilot DataFlash (.bin) logs for benchmarks.
+
+The generated flight has a takeoff, a cruise and a landing, with a GPS
+dropout, a current surge with an altitude loss and a couple of ERR events
+so every detector and query path has something to find. ISBD carries a
+32-sample array field, like IMU batch sampling logs.
+"""
+import argparse
+import struct
+
+import numpy as np
+
+HEAD = b"\xa3\x95"
+FMT_ID = 128
+
+# name -> (id, format, columns, rate Hz)
+MESSAGES = {
+    "PARM": (129, "QNf", "TimeUS,Name,Value", 0),
+    "MODE": (130, "QMBB", "TimeUS,Mode,ModeNum,Rsn", 0),
+    "GPS": (131, "QBIHBcLLeffB", "TimeUS,Status,GMS,GWk,NSats,HDop,Lat,Lng,Alt,Spd,GCrs,U", 10),
+    "ATT": (132, "QccccCCCC", "TimeUS,DesRoll,Roll,DesPitch,Pitch,DesYaw,Yaw,ErrRP,ErrYaw", 25),
+    "BAT": (133, "QBfffffcf", "TimeUS,Inst,Volt,VoltR,Curr,CurrTot,EnrgTot,Temp,Res", 10),
+    "CTUN": (134, "Qffffffffc", "TimeUS,ThI,ABst,ThO,ThH,DAlt,Alt,BAlt,DCRt,CRt", 25),
+    "BARO": (135, "QBffcfI", "TimeUS,I,Alt,Press,Temp,CRt,SMS", 10),
+    "ERR": (136, "QBB", "TimeUS,Subsys,ECode", 0),
+    "MSG": (137, "QZ", "TimeUS,Message", 0),
+    "ISBD": (138, "QHHa", "TimeUS,N,seqno,x", 1),
+}
+
+STRUCT_CHARS = {
+    "b": "i1", "B": "u1", "h": "<i2", "H": "<u2", "i": "<i4", "I": "<u4",
+    "f": "<f4", "d": "<f8", "n": "S4", "N": "S16", "Z": "S64",
+    "c": "<i2", "C": "<u2", "e": "<i4", "E": "<u4", "L": "<i4",
+    "M": "u1", "q": "<i8", "Q": "<u8", "a": ("<i2", (32,)),
+}
+SCALE = {"c": 100.0, "C": 100.0, "e": 100.0, "E": 100.0, "L": 1e7}
+
+
+def _record_dtype(fmt, columns):
+    fields = [("h1", "u1"), ("h2", "u1"), ("id", "u1")]
+    for ch, col in zip(fmt, columns.split(",")):
+        dtype = STRUCT_CHARS[ch]
+        # array fields are (base dtype, shape)
+        fields.append((col, *dtype) if isinstance(dtype, tuple) else (col, dtype))
+    return np.dtype(fields)
+
+
+def _records(name, values):
+    msg_id, fmt, columns, _ = MESSAGES[name]
+    dtype = _record_dtype(fmt, columns)
+    n = len(values["TimeUS"])
+    rec = np.zeros(n, dtype=dtype)
+    rec["h1"], rec["h2"], rec["id"] = 0xA3, 0x95, msg_id
+    for ch, col in zip(fmt, columns.split(",")):
+        v = np.asarray(values.get(col, 0))
+        if ch in SCALE:
+            v = np.round(v * SCALE[ch])
+        rec[col] = v
+    return rec
+
+
+def _fmt_record(name):
+    msg_id, fmt, columns, _ = MESSAGES[name]
+    length = _record_dtype(fmt, columns).itemsize
+    return HEAD + struct.pack(
+        "<BBB4s16s64s", FMT_ID, msg_id, length,
+        name.encode(), fmt.encode(), columns.encode(),
+    )
+
+
+def flight_profile(duration_s=600.0, scale=1, seed=0):
+    """Return {msg_type: {field: array}} for a synthetic flight."""
+    rng = np.random.default_rng(seed)
+    out = {}
+
+    def timebase(rate):
+        n = int(duration_s * rate * scale)
+        return np.linspace(0, duration_s * 1e6, n, endpoint=False).astype(np.uint64) + 1_000_000
+
+    def altitude(t_us):
+        t = (t_us - 1e6) / 1e6
+        climb = np.clip(t / 30.0, 0, 1) * 50.0
+        land = np.clip((duration_s - t) / 30.0, 0, 1)
+        alt = climb * land
+        # altitude loss during the current surge
+        surge = (t > duration_s * 0.6) & (t < duration_s * 0.6 + 4)
+        alt = alt - np.where(surge, (t - duration_s * 0.6) * 6.0, 0)
+        return alt
+
+    t = timebase(MESSAGES["GPS"][3])
+    tt = (t - 1e6) / 1e6
+    nsats = np.full(len(t), 12)
+    hdop = np.full(len(t), 0.8)
+    loss = (tt > duration_s * 0.3) & (tt < duration_s * 0.3 + 8)
+    nsats[loss] = 3
+    hdop[loss] = 4.5
+    out["GPS"] = {
+        "TimeUS": t, "Status": np.where(loss, 1, 3), "GMS": (tt * 1000).astype(np.uint32),
+        "GWk": 2200, "NSats": nsats, "HDop": hdop,
+        "Lat": -35.36 + tt * 1e-5, "Lng": 149.16 + tt * 1e-5,
+        "Alt": 584.0 + altitude(t), "Spd": np.clip(tt, 0, 12), "GCrs": 90.0, "U": 1,
+    }
+
+    t = timebase(MESSAGES["ATT"][3])
+    out["ATT"] = {
+        "TimeUS": t, "Roll": rng.normal(0, 2, len(t)), "Pitch": rng.normal(0, 2, len(t)),
+        "Yaw": (np.arange(len(t)) * 0.01) % 360,
+    }
+
+    t = timebase(MESSAGES["BAT"][3])
+    tt = (t - 1e6) / 1e6
+    curr = np.full(len(t), 15.0) + rng.normal(0, 0.5, len(t))
+    surge = (tt > duration_s * 0.6) & (tt < duration_s * 0.6 + 4)
+    curr[surge] = 55.0
+    volt = 16.8 - tt / duration_s * 2.0 - np.where(surge, 1.8, 0)
+    out["BAT"] = {
+        "TimeUS": t, "Inst": 0, "Volt": volt, "VoltR": volt + 0.2, "Curr": curr,
+        "CurrTot": np.cumsum(curr) / 36.0, "EnrgTot": np.cumsum(curr * volt) / 3600.0,
+        "Temp": 30.0, "Res": 0.02,
+    }
+
+    t = timebase(MESSAGES["CTUN"][3])
+    alt = altitude(t)
+    out["CTUN"] = {
+        "TimeUS": t, "ThO": 0.5, "ThH": 0.5, "DAlt": alt, "Alt": alt + rng.normal(0, 0.1, len(t)),
+        "BAlt": alt, "CRt": np.gradient(alt) * MESSAGES["CTUN"][3] * scale,
+    }
+
+    t = timebase(MESSAGES["BARO"][3])
+    out["BARO"] = {"TimeUS": t, "Alt": altitude(t), "Press": 101325.0, "Temp": 25.0}
+
+    t = timebase(MESSAGES["ISBD"][3])
+    out["ISBD"] = {"TimeUS": t, "N": 1, "seqno": np.arange(len(t)) % 65536,
+                   "x": rng.integers(-2000, 2000, (len(t), 32))}
+
+    end_us = 1_000_000 + int(duration_s * 1e6)
+    out["MODE"] = {
+        "TimeUS": np.array([1_000_000, 1_000_000 + 35e6, end_us - 40e6], dtype=np.uint64),
+        "Mode": np.array([0, 3, 9]), "ModeNum": np.array([0, 3, 9]), "Rsn": 1,
+    }
+    out["ERR"] = {
+        "TimeUS": np.array([1_000_000 + duration_s * 0.3e6, 1_000_000 + duration_s * 0.3e6 + 8e6],
+                           dtype=np.uint64),
+        "Subsys": np.array([11, 11]), "ECode": np.array([2, 0]),
+    }
+    out["MSG"] = {"TimeUS": np.array([1_000_000], dtype=np.uint64),
+                  "Message": np.array([b"ArduCopter V4.5.0 synthetic"])}
+    out["PARM"] = {"TimeUS": np.array([500_000, 500_000], dtype=np.uint64),
+                   "Name": np.array([b"BATT_CAPACITY", b"FS_BATT_VOLTAGE"]),
+                   "Value": np.array([5000.0, 14.0])}
+    return out
+
+
+def write_log(path, duration_s=600.0, scale=1, seed=0):
+    """Write a synthetic DataFlash log to ``path`` and return its size in bytes."""
+    profile = flight_profile(duration_s, scale, seed)
+    blobs, times, lengths = [], [], []
+    for name, values in profile.items():
+        rec = _records(name, values)
+        blobs.append(rec.view(np.uint8).reshape(len(rec), rec.dtype.itemsize))
+        times.append(rec["TimeUS"].astype(np.int64))
+        lengths.append(np.full(len(rec), rec.dtype.itemsize))
+
+    flat = np.concatenate([b.ravel() for b in blobs])
+    lengths = np.concatenate(lengths)
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    order = np.argsort(np.concatenate(times), kind="stable")
+    starts, lengths = starts[order], lengths[order]
+    # expand (start, length) pairs into a byte gather index
+    index = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    index += np.arange(lengths.sum())
+
+    header = b"".join(_fmt_record(name) for name in MESSAGES)
+    with open(path, "wb") as f:
+        f.write(HEAD + struct.pack("<BBB4s16s64s", FMT_ID, FMT_ID, 89, b"FMT", b"BBnNZ",
+                                   b"Type,Length,Name,Format,Columns"))
+        f.write(header)
+        f.write(flat[index].tobytes())
+    return len(header) + 89 + int(lengths.sum())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("path")
+    parser.add_argument("--duration", type=float, default=600.0, help="flight length in seconds")
+    parser.add_argument("--scale", type=int, default=1, help="multiply every logging rate")
+    args = parser.parse_args()
+    size = write_log(args.path, args.duration, args.scale)
+    print(f"wrote {size / 1e6:.1f} MB to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,41 @@
 import openai
 import os
 import json
+import logging
 import faiss
 import numpy as np
+import threading
 import time
+from chat.chunker import chunk_log, chunker_key, estimate_tokens
+from chat.embeddings import EMBEDDING_DIM, embed_texts, get_embedder
+from chat.query_engine import QueryEngine, TOOLS, TOOL_NAMES
+from chat.retrieval import (HNSW_M, HNSW_MIN_CHUNKS, INDEX_VERSION, RERANK_POOL, matching_chunks,
+                            message_types, new_index, normalized, rerank_adjacent, search, time_range)
+from chat.risk_engine import score_flight
+from metrics import metrics
+from telemetry_parser.mavlog_parser import get_columns
+
+logger = logging.getLogger(__name__)
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-EMBEDDING_MODEL = "text-embedding-3-small"
-EMBEDDING_DIM = 1536
+# Upper bound on concurrent completion calls across all chat threads
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", 8))
+_llm_slots = threading.BoundedSemaphore(LLM_CONCURRENCY)
+
+# Query engine tool calls the model may make before it has to answer
+MAX_TOOL_ROUNDS = int(os.getenv("MAX_TOOL_ROUNDS", 4))
+
+# Chunks retrieved per query, then trimmed so the whole prompt fits the budget
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 8))
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", 4000))
+# the per-query prompt wrapped around the question and the chunks
+PROMPT_TEMPLATE_TOKENS = 250
+# part of the budget kept for retrieved chunks, chat history is trimmed to leave it
+MIN_CHUNK_TOKENS = int(os.getenv("MIN_CHUNK_TOKENS", 1500))
+TRUNCATED_MARK = " [...]"
+# tokens tool results may add on top of PROMPT_TOKEN_BUDGET over one answer's rounds
+TOOL_TOKEN_BUDGET = int(os.getenv("TOOL_TOKEN_BUDGET", 2000))
 
 SYSTEM_PROMPT = """
 You are an expert UAV flight log analyst with deep expertise in ArduPilot systems and flight safety. Your analysis should rely on contextual reasoning using telemetry trends, flight dynamics, and system behavior, guided by the official ArduPilot documentation (https://ardupilot.org/plane/docs/logmessages.html).
@@ -104,15 +131,103 @@ Formatting Rules:
 Your goal: Be technically deep, situationally aware, and guidance-oriented.
 """
 
-# --- Vector Store Globals ---
-index = faiss.IndexFlatL2(EMBEDDING_DIM)
-chunk_texts = []
+# --- Vector Store ---
+# stored indexes are memory-mapped rather than read in, where this FAISS build supports it
+MMAP_INDEX_FLAGS = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+class VectorStore:
+    """
+    FAISS index, chunk texts and chunk metadata (msgType, startUs, endUs) for
+    one session's log. Vectors are normalised and searched by inner product,
+    i.e. cosine similarity; see chat.retrieval for the index choice.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.index = new_index(dim, 0)
+        self.chunk_texts = []
+        self.chunk_meta = []
+        self._filter_columns = None
+
+    def add(self, embeddings, chunk_texts, chunk_meta=None):
+        vectors = normalized(embeddings)
+        total = self.index.ntotal + len(vectors)
+        if isinstance(self.index, faiss.IndexFlatIP) and total > HNSW_MIN_CHUNKS:
+            # outgrew exhaustive search, move what is there to an HNSW graph
+            existing = self.index.reconstruct_n(0, self.index.ntotal)
+            self.index = new_index(self.index.d, total)
+            self.index.add(existing)
+        self.index.add(vectors)
+        self.chunk_texts.extend(chunk_texts)
+        self.chunk_meta.extend(chunk_meta or [{} for _ in chunk_texts])
+        self._filter_columns = None
+
+    def nbytes(self):
+        per_vector = self.index.d * 4
+        if isinstance(self.index, faiss.IndexHNSWFlat):
+            per_vector += HNSW_M * 8  # graph links
+        return self.index.ntotal * per_vector + sum(len(t) for t in self.chunk_texts)
+
+    def filter_columns(self):
+        """msgType, startUs and endUs of every chunk as arrays, for metadata filters."""
+        if self._filter_columns is None:
+            meta = self.chunk_meta
+            self._filter_columns = (
+                np.array([m.get("msgType", "") for m in meta]),
+                np.array([m.get("startUs", 0) for m in meta], dtype=np.int64),
+                np.array([m.get("endUs", 0) for m in meta], dtype=np.int64),
+            )
+        return self._filter_columns
+
+    def search(self, query_embedding, top_k: int, types=None, span=None):
+        """
+        Chunks most similar to the query, restricted to the given message
+        types and time span when they match anything, then reranked to
+        favour adjacent time windows.
+
+        Returns:
+            list: (similarity, chunk id) pairs
+        """
+        ids = matching_chunks(*self.filter_columns(), types, span)
+        if ids is not None and not len(ids):
+            # the filter matches no chunk, search everything rather than nothing
+            ids = None
+        scores, found = search(self.index, normalized(query_embedding)[0], top_k * RERANK_POOL, ids)
+        return rerank_adjacent(scores, found, self.chunk_meta, top_k)
+
+    def save(self, index_path, chunks_path):
+        # the index is written last and renamed into place, so its presence marks a complete save
+        with open(chunks_path, "w") as f:
+            json.dump({"texts": self.chunk_texts, "meta": self.chunk_meta}, f)
+        faiss.write_index(self.index, index_path + ".tmp")
+        os.replace(index_path + ".tmp", index_path)
+
+    @classmethod
+    def load(cls, index_path, chunks_path):
+        """Return a stored VectorStore, or None if it is missing or incomplete."""
+        try:
+            with open(chunks_path) as f:
+                chunks = json.load(f)
+            # vectors stay in the file's page cache, shared by every worker serving the log
+            index = faiss.read_index(index_path, MMAP_INDEX_FLAGS)
+        except (OSError, ValueError, RuntimeError):
+            return None
+        if not isinstance(chunks, dict):
+            return None
+        store = cls(index.d)
+        store.index = index
+        store.chunk_texts = chunks["texts"]
+        store.chunk_meta = chunks["meta"]
+        return store
+
+
+def vector_store_key():
+    """Identifies how a stored index was built, so stale ones are not reused."""
+    return f"{get_embedder().model}-{chunker_key()}-{INDEX_VERSION}"
 
 # --- Embedding Function ---
 def embed_text(text):
-    response = openai.Embedding.create(input=text, model=EMBEDDING_MODEL)
-    # time.sleep(1.1)  # Prevent API rate limit
-    return response['data'][0]['embedding']
+    return embed_texts([text])[0]
 
 def default_json(obj):
     if isinstance(obj, bytes):
@@ -122,49 +237,65 @@ def default_json(obj):
     return f"<<non-serializable: {type(obj).__name__}>>"
 
 # --- Build Vector Store from Log Data ---
-def build_vector_store(parsed_data):
-    global chunk_texts, index
-    all_messages = parsed_data.get("messages", {})
-    preferred_order = ["ERR", "GPS", "ATT", "BAT", "CTUN", "BARO"]
-    other_keys = [k for k in all_messages.keys() if k not in preferred_order]
-    all_keys = preferred_order + sorted(other_keys)
-
-    for msg_type in all_keys:
-        entries = all_messages.get(msg_type, [])
-        for i in range(0, len(entries), 100):
-            chunk_entries = entries[i:i + 100]
-            chunk_text = f"== {msg_type} CHUNK ==\n" + json.dumps(chunk_entries[:10], default=default_json)
-            embedding = embed_text(chunk_text)
-            index.add(np.array([embedding], dtype=np.float32))
-            chunk_texts.append(chunk_text)
+def build_vector_store(parsed_data, findings=None):
+    """Embed one statistical summary chunk per message type and time window (see chat.chunker)."""
+    with metrics.span("chunk"):
+        texts, meta = chunk_log(parsed_data, findings)
+    store = VectorStore(get_embedder().dim)
+    if texts:
+        with metrics.span("embed_chunks"):
+            embeddings = embed_texts(texts)
+        store.add(embeddings, texts, meta)
+    return store
 
 # --- Retrieve Most Relevant Chunks Based on User Query ---
-def retrieve_relevant_chunks(query, top_k=3):
-    query_embedding = embed_text(query)
-    D, I = index.search(np.array([query_embedding], dtype=np.float32), top_k)
-    results = []
-    for score, i in zip(D[0], I[0]):
-        if i < len(chunk_texts):
-            results.append((score, chunk_texts[i]))
-    return results
+def retrieve_relevant_chunks(query, store, top_k=3, columns=None):
+    """
+    Top chunks for the query as (similarity, text). Message types, field
+    names (looked up in columns, if given) and time ranges the question
+    mentions restrict the search to matching chunks.
+    """
+    with metrics.span("embed_query"):
+        query_embedding = embed_text(query)
+    types, span = message_types(query, columns), time_range(query)
+    metrics.inc("retrieval_searches_total",
+                filter="+".join(name for name, on in (("type", types), ("time", span)) if on) or "none")
+    with metrics.span("faiss_search"):
+        hits = store.search(query_embedding, top_k, types, span)
+    return [(score, store.chunk_texts[i]) for score, i in hits]
 
 # --- Chat Function with RAG ---
-def chat_with_log(query: str, parsed_data: dict, chat_history: list = None) -> str:
+def build_chat_messages(query: str, parsed_data: dict, chat_history: list = None,
+                        vector_store: VectorStore = None) -> list:
+    """Retrieve context for the query and assemble the completion messages."""
     if chat_history is None:
         chat_history = []
 
-    if not chunk_texts or index.ntotal == 0:
-        print("\n==>Building vector store<==\n")
-        build_vector_store(parsed_data)
-        print("\n==>Vector store built successfully.<==\n")
-
-    relevant_chunks = retrieve_relevant_chunks(query)
+    if vector_store is None:
+        logger.info("building vector store")
+        with metrics.span("build_vector_store"):
+            vector_store = build_vector_store(parsed_data)
+
+    relevant_chunks = retrieve_relevant_chunks(query, vector_store, RETRIEVAL_TOP_K, get_columns(parsed_data))
+    # history gets what the fixed parts leave beyond MIN_CHUNK_TOKENS, the chunks get the rest
+    budget = max(PROMPT_TOKEN_BUDGET - estimate_tokens(SYSTEM_PROMPT + query) - PROMPT_TEMPLATE_TOKENS, 0)
+    chat_history = _fit_history(chat_history, budget - MIN_CHUNK_TOKENS)
+    budget -= sum(estimate_tokens(m["content"]) for m in chat_history)
+    # keep the best-ranked chunks that fit
+    selected = []
+    for score, chunk in relevant_chunks:
+        cost = estimate_tokens(chunk)
+        if cost <= budget:
+            selected.append((score, chunk))
+            budget -= cost
+    if len(selected) < len(relevant_chunks):
+        logger.warning("prompt budget fits %d of %d retrieved chunks", len(selected), len(relevant_chunks))
+    relevant_chunks = selected
     context = "\n\n".join([chunk for _, chunk in relevant_chunks])
-    
-    print("\n Top Matching Chunks for Query:")
-    for idx, (score, chunk) in enumerate(relevant_chunks):
-        preview = chunk.split("\n")[0] 
-        print(f"  {idx+1}. {preview}  (distance: {score:.4f})")
+
+    if logger.isEnabledFor(logging.DEBUG):
+        for idx, (score, chunk) in enumerate(relevant_chunks):
+            logger.debug("chunk %d: %s (similarity %.4f)", idx + 1, chunk.split("\n")[0], score)
 
     prompt = f"""You are a UAV flight log assistant.
 
@@ -186,76 +317,165 @@ Formatting Rules:
 - Use bullet points (•) and dashes (-) as needed
 - Do not strictly use markdown symbols (e.g., do not use **, ##, etc.)
 
+Use the telemetry tools for exact values (extremes, first occurrences, durations, mode changes, errors) instead of estimating them from the chunks above.
+
 Your goal: Be technically deep, situationally aware, and guidance-oriented.
 """
 
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        *chat_history,
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _fit_history(chat_history: list, max_tokens: int):
+    """
+    The most recent messages of chat_history that fit in max_tokens. The
+    newest message that does not fit whole is cut short, older ones are
+    dropped.
+    """
+    kept = []
+    for message in reversed(chat_history):
+        cost = estimate_tokens(message["content"])
+        if cost > max_tokens:
+            # keep the start of it, answers open with their summary
+            chars = (max_tokens - 1) * 4 - len(TRUNCATED_MARK)
+            if chars > 0:
+                kept.append({**message, "content": message["content"][:chars] + TRUNCATED_MARK})
+            logger.info("chat history trimmed to %d of %d messages for the prompt budget",
+                        len(kept), len(chat_history))
+            break
+        kept.append(message)
+        max_tokens -= cost
+    return kept[::-1]
+
+
+def _call_tool(engine: QueryEngine, messages: list, name: str, arguments: str):
+    """Run a query engine tool the model asked for and add the exchange to messages."""
+    logger.info("tool %s(%s)", name, arguments)
+    with metrics.span("tool_call"):
+        result = engine.call(name, arguments)
+    # names the model made up share one series
+    metrics.inc("tool_calls_total", tool=name if name in TOOL_NAMES else "unknown")
+    messages.append({"role": "assistant", "content": None,
+                     "function_call": {"name": name, "arguments": arguments or "{}"}})
+    # tool output counts against the same budget as the prompt it is added to
+    room = PROMPT_TOKEN_BUDGET + TOOL_TOKEN_BUDGET - _prompt_tokens(messages)
+    messages.append({"role": "function", "name": name, "content": _fit_tool_result(result, room)})
+
+
+def _fit_tool_result(result, max_tokens: int):
+    """
+    JSON of a tool result in at most max_tokens: the longest list (or
+    mapping) in it is halved until it fits, and "omitted" counts the items
+    dropped. A result that still does not fit is replaced by an error.
+    """
+    text = json.dumps(result, default=default_json)
+    while estimate_tokens(text) > max_tokens and isinstance(result, dict):
+        key = max((k for k, v in result.items() if isinstance(v, (list, dict)) and len(v) > 1),
+                  key=lambda k: len(result[k]), default=None)
+        if key is None:
+            break
+        items = result[key]
+        kept = len(items) // 2
+        trimmed = items[:kept] if isinstance(items, list) else dict(list(items.items())[:kept])
+        result = {**result, key: trimmed, "omitted": result.get("omitted", 0) + len(items) - kept}
+        text = json.dumps(result, default=default_json)
+    if estimate_tokens(text) > max_tokens:
+        text = json.dumps({"error": "the result does not fit in the prompt, ask for something narrower"})
+    return text
+
+
+def _prompt_tokens(messages: list):
+    return sum(estimate_tokens(m.get("content") or json.dumps(m.get("function_call"))) for m in messages)
+
+
+def _record_usage(prompt_tokens: int, completion_tokens: int):
+    metrics.inc("prompt_tokens_total", prompt_tokens)
+    metrics.inc("completion_tokens_total", completion_tokens)
+
+
+def chat_with_log(query: str, parsed_data: dict, chat_history: list = None,
+                  vector_store: VectorStore = None) -> str:
+    messages = build_chat_messages(query, parsed_data, chat_history, vector_store)
+    engine = QueryEngine(parsed_data)
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-4-turbo",
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                *chat_history,
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.4,
-            max_tokens=3000
-        )
-        return response['choices'][0]['message']['content']
+        for round_num in range(MAX_TOOL_ROUNDS + 1):
+            with _llm_slots, metrics.span("completion"):
+                response = openai.ChatCompletion.create(
+                    model="gpt-4-turbo",
+                    messages=messages,
+                    functions=TOOLS,
+                    # last round: no more tool calls, the model has to answer
+                    function_call="auto" if round_num < MAX_TOOL_ROUNDS else "none",
+                    temperature=0.4,
+                    max_tokens=3000
+                )
+            message = response['choices'][0]['message']
+            usage = response.get('usage')
+            if usage:
+                _record_usage(usage['prompt_tokens'], usage['completion_tokens'])
+            else:
+                _record_usage(_prompt_tokens(messages), estimate_tokens(message.get('content') or ""))
+            call = message.get('function_call')
+            if not call:
+                return message['content']
+            _call_tool(engine, messages, call['name'], call.get('arguments'))
+        return message.get('content') or ""
     except Exception as e:
         return f"Error: {str(e)}"
 
 
-def compute_flight_risk(parsed_data):
-    score = 0
-    details = []
-    messages = parsed_data.get("messages", {})
-
-    # --- GPS Risk ---
-    gps_data = messages.get("GPS", [])
-    gps_issues = [
-        g for g in gps_data if g.get("NSats", 8) < 5 or g.get("HDop", 1) > 3
-    ]
-    if gps_issues:
-        score += 40
-        details.append("GPS signal quality issues detected (low NSats or high HDop).")
-
-    # --- Battery Voltage Drop ---
-    bat_data = messages.get("BAT", [])
-    for i in range(1, len(bat_data)):
-        v1 = bat_data[i-1].get("Volt", 0)
-        v2 = bat_data[i].get("Volt", 0)
-        if v1 - v2 > 1.5:
-            score += 30
-            details.append("Significant battery voltage drop detected.")
-            break
+def stream_chat_with_log(query: str, parsed_data: dict, chat_history: list = None,
+                         vector_store: VectorStore = None):
+    """
+    Streaming variant of chat_with_log: yields the answer text as the model
+    produces it. Tool calls are resolved between rounds, only the final
+    answer is streamed. Closing the generator closes the upstream stream.
+
+    Unlike chat_with_log, failures are raised rather than returned as an
+    "Error: ..." answer, since part of the answer may already have been
+    sent; the caller reports them separately.
+    """
+    messages = build_chat_messages(query, parsed_data, chat_history, vector_store)
+    engine = QueryEngine(parsed_data)
+    for round_num in range(MAX_TOOL_ROUNDS + 1):
+        # streamed responses carry no usage, so tokens are estimated
+        prompt_tokens = _prompt_tokens(messages)
+        start = time.perf_counter()
+        with _llm_slots:
+            stream = openai.ChatCompletion.create(
+                model="gpt-4-turbo",
+                messages=messages,
+                functions=TOOLS,
+                function_call="auto" if round_num < MAX_TOOL_ROUNDS else "none",
+                temperature=0.4,
+                max_tokens=3000,
+                stream=True
+            )
+            name, arguments, content = None, "", ""
+            try:
+                for chunk in stream:
+                    delta = chunk['choices'][0].get('delta', {})
+                    call = delta.get('function_call')
+                    if call:
+                        name = call.get('name') or name
+                        arguments += call.get('arguments') or ""
+                    elif delta.get('content'):
+                        if not content:
+                            metrics.observe("first_token", time.perf_counter() - start)
+                        content += delta['content']
+                        yield delta['content']
+            finally:
+                stream.close()
+                metrics.observe("completion", time.perf_counter() - start)
+                _record_usage(prompt_tokens, estimate_tokens(content + arguments))
+        if name is None:
+            return
+        _call_tool(engine, messages, name, arguments)
 
-    # --- Subsystem Errors ---
-    err_data = messages.get("ERR", [])
-    err_codes = [e for e in err_data if e.get("ECode") not in (0, None)]
-    if err_codes:
-        score += 50
-        details.append(f"{len(err_codes)} critical error messages found in ERR logs.")
-
-    # --- Altitude Spikes ---
-    ctun_data = messages.get("CTUN", [])
-    for i in range(1, len(ctun_data)):
-        alt1 = ctun_data[i-1].get("Alt", 0)
-        alt2 = ctun_data[i].get("Alt", 0)
-        if abs(alt2 - alt1) > 10:
-            score += 20
-            details.append("Sudden altitude fluctuation (>10m) detected.")
-            break
 
-    # --- Risk Interpretation ---
-    if score <= 30:
-        risk_level = "Low"
-    elif score <= 60:
-        risk_level = "Moderate"
-    else:
-        risk_level = "High"
-
-    return {
-        "score": score,
-        "riskLevel": risk_level,
-        "details": details
-    }
+def compute_flight_risk(parsed_data):
+    """Score a parsed log with the detectors registered in chat.risk_engine."""
+    return score_flight(parsed_data)
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import numpy as np
+from chat.embeddings import embed_texts, get_embedder
+from metrics import metrics
+
+# --- Answer Cache Settings (override through the environment) ---
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", "cache/answers.sqlite")
+# stored answers before the least recently used are evicted, 0 disables the cache
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 5000))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", 86400))
+# cosine similarity between question embeddings for a stored answer to be reused
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+# only reuse answers given after the same preceding exchange
+ANSWER_CACHE_MATCH_HISTORY = os.getenv("ANSWER_CACHE_MATCH_HISTORY", "true").lower() in ("1", "true", "yes")
+
+
+def normalize_query(query: str):
+    """Case, spacing and trailing punctuation do not change a question."""
+    return re.sub(r"\s+", " ", query).strip().rstrip("?.! ").lower()
+
+
+def history_key(history):
+    """sha256 of the chat history sent with a question, "" when history is not matched."""
+    if not ANSWER_CACHE_MATCH_HISTORY:
+        return ""
+    context = [(m.get("role"), m.get("content")) for m in history or []]
+    return hashlib.sha256(json.dumps(context).encode()).hexdigest()
+
+
+class AnswerCache:
+    """
+    Answers to earlier questions about the same log, in SQLite.
+
+    Entries are keyed by the log's sha256 and the embedding model, and
+    optionally the preceding chat history. A question is answered from the
+    cache if it matches a stored one after normalisation (no embedding
+    call) or if its embedding is at least `similarity` cosine-similar to a
+    stored question's. Entries expire after ttl_seconds; beyond
+    max_entries the least recently used are evicted.
+    """
+
+    def __init__(self, path: str = ANSWER_CACHE_PATH, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = ANSWER_CACHE_TTL_SECONDS, similarity: float = ANSWER_CACHE_SIMILARITY):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity = similarity
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # shared by every uvicorn worker, readers do not block the writer
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "id INTEGER PRIMARY KEY, digest TEXT NOT NULL, model TEXT NOT NULL, history TEXT NOT NULL, "
+            "query TEXT NOT NULL, vector BLOB NOT NULL, answer TEXT NOT NULL, "
+            "created REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_log ON answers (digest, model, history)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS answers_last_used ON answers (last_used)")
+        self._db.commit()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def get(self, digest: str, query: str, history=None):
+        """
+        Return (answer, similarity) of the closest stored question about the
+        same log, or None if none is similar enough.
+
+        Args:
+            digest (str): sha256 of the log
+            query (str): The question
+            history (list): Chat messages sent along with the question
+        """
+        if not self.enabled or digest is None:
+            return None
+        model = get_embedder().model
+        context = history_key(history)
+        normalized = normalize_query(query)
+        oldest = time.time() - self.ttl_seconds
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, query, vector, answer FROM answers "
+                "WHERE digest = ? AND model = ? AND history = ? AND created >= ?",
+                (digest, model, context, oldest),
+            ).fetchall()
+        found = next(((row_id, answer, 1.0) for row_id, q, _, answer in rows if q == normalized), None)
+        if found is None and rows:
+            with metrics.span("answer_cache_search"):
+                # the question as asked, so retrieval finds its embedding in the embedding cache
+                vector = embed_texts([query])[0]
+                stored = np.stack([np.frombuffer(v, dtype=np.float32) for _, _, v, _ in rows])
+                similarities = stored @ vector / (np.linalg.norm(stored, axis=1) * np.linalg.norm(vector) + 1e-12)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity:
+                found = rows[best][0], rows[best][3], float(similarities[best])
+
+        with self._lock:
+            if found is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._db.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), found[0]))
+                self._db.commit()
+        metrics.inc("answer_cache_lookups_total", result="miss" if found is None else "hit")
+        return None if found is None else found[1:]
+
+    def put(self, digest: str, query: str, answer: str, history=None):
+        """Store an answer, then drop expired entries and evict down to max_entries."""
+        if not self.enabled or digest is None:
+            return
+        normalized = normalize_query(query)
+        model, context = get_embedder().model, history_key(history)
+        vector = np.asarray(embed_texts([query])[0], dtype=np.float32)
+        now = time.time()
+        with self._lock:
+            # a question asked again while the first answer was pending replaces it
+            self._db.execute("DELETE FROM answers WHERE digest = ? AND model = ? AND history = ? AND query = ?",
+                             (digest, model, context, normalized))
+            self._db.execute(
+                "INSERT INTO answers (digest, model, history, query, vector, answer, created, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (digest, model, context, normalized, vector.tobytes(), answer, now, now),
+            )
+            self._db.execute("DELETE FROM answers WHERE created < ?", (now - self.ttl_seconds,))
+            self._db.execute(
+                "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self),
+                "hitRate": self.hits / lookups if lookups else 0.0}
+
+
+_answer_cache = None
+
+
+def get_answer_cache():
+    global _answer_cache
+    if _answer_cache is None:
+        _answer_cache = AnswerCache()
+    return _answer_cache
+
+
+def set_answer_cache(cache):
+    global _answer_cache
+    _answer_cache = cache
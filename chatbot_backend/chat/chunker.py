@@ -0,0 +1,216 @@
+import os
+import numpy as np
+from telemetry_parser.mavlog_parser import get_columns
+
+# --- Chunking Settings (override through the environment) ---
+CHUNK_WINDOW_S = float(os.getenv("CHUNK_WINDOW_S", 60))
+# LTTB points per field and window appended to each chunk, 0 to disable
+CHUNK_LTTB_POINTS = int(os.getenv("CHUNK_LTTB_POINTS", 0))
+# windows with at most this many rows, and types with text fields, are listed row by row
+LIST_ROWS_MAX = 20
+
+# bump when the chunk text format changes, stored indexes are keyed on it
+CHUNKER_VERSION = 1
+
+US = 1_000_000
+
+
+def chunker_key():
+    """Identifies the chunking settings a stored index was built with."""
+    return f"chunks{CHUNKER_VERSION}-w{CHUNK_WINDOW_S:g}-l{CHUNK_LTTB_POINTS}"
+
+
+def estimate_tokens(text: str):
+    """Rough token count (about 4 characters per token for English and numbers)."""
+    return len(text) // 4 + 1
+
+
+def _num(value):
+    return f"{value:.4g}"
+
+
+def _text(value):
+    return value.decode("utf-8", errors="replace") if isinstance(value, bytes) else str(value)
+
+
+def _scalar_fields(fields):
+    """
+    Fields with one value per message. Array fields (tlog BATTERY_STATUS
+    voltages, DataFlash "a" fields such as ISBD sample blocks) are left out.
+    """
+    return {name: values for name, values in fields.items() if np.ndim(values) == 1}
+
+
+def _is_text(values):
+    return values.dtype.kind in "OSU"
+
+
+def _cell(values, i):
+    return _text(values[i]) if _is_text(values) else _num(values[i])
+
+
+def _sec(time_us):
+    return f"{int(time_us) / US:.1f}s"
+
+
+# --- Downsampling ---
+def lttb(t, values, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points and, from each of n_out - 2 buckets,
+    the point forming the largest triangle with the previous pick and the
+    next bucket's mean, which preserves peaks and dips a plot would show.
+
+    Returns:
+        np.ndarray: indices of the kept samples
+    """
+    n = len(values)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = t.astype(np.float64)
+    y = values.astype(np.float64)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    picked = np.empty(n_out, dtype=np.int64)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nxt_lo, nxt_hi = hi, edges[i + 2] if i + 2 < len(edges) else n
+        nx, ny = x[nxt_lo:nxt_hi].mean(), y[nxt_lo:nxt_hi].mean()
+        area = np.abs((x[a] - nx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (ny - y[a]))
+        a = lo + int(np.argmax(area))
+        picked[i + 1] = a
+    return picked
+
+
+# --- Window Statistics ---
+def window_stats(t, values, starts):
+    """
+    Per-window count, min, max, mean and least-squares slope (per second),
+    computed for every window at once with ufunc.reduceat. NaNs are ignored.
+    """
+    valid = ~np.isnan(values)
+    v = np.where(valid, values, 0.0)
+    # time relative to each window's first sample keeps the sums well conditioned
+    group = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, len(t))))
+    ts = np.where(valid, (t - t[starts][group]) / US, 0.0)
+
+    n = np.add.reduceat(valid.astype(np.float64), starts)
+    s_t = np.add.reduceat(ts, starts)
+    s_v = np.add.reduceat(v, starts)
+    s_tt = np.add.reduceat(ts * ts, starts)
+    s_tv = np.add.reduceat(ts * v, starts)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = s_v / n
+        denom = n * s_tt - s_t * s_t
+        slope = np.where(denom > 0, (n * s_tv - s_t * s_v) / denom, 0.0)
+    return {
+        "count": n,
+        "min": np.fmin.reduceat(values, starts),
+        "max": np.fmax.reduceat(values, starts),
+        "mean": mean,
+        "slope": slope,
+    }
+
+
+def _event_markers(findings, start_us, end_us):
+    markers = []
+    for finding in findings or ():
+        for window in finding.get("windows", ()):
+            if window["startUs"] <= end_us and window["endUs"] >= start_us:
+                span = _sec(window["startUs"])
+                if window["endUs"] != window["startUs"]:
+                    span += f"-{_sec(window['endUs'])}"
+                markers.append(f"{finding['detector']} {span}")
+    return markers
+
+
+# --- Chunking ---
+def _row_chunks(msg_type, fields, starts, ends):
+    """Sparse or text-bearing messages: list the rows themselves, LIST_ROWS_MAX per chunk."""
+    names = [name for name in fields if name != "TimeUS"]
+    t = fields["TimeUS"]
+    chunks = []
+    for lo, hi in zip(starts, ends):
+        for first in range(lo, hi, LIST_ROWS_MAX):
+            last = min(first + LIST_ROWS_MAX, hi)
+            rows = [
+                f"{_sec(t[i])} " + " ".join(f"{name}={_cell(fields[name], i)}" for name in names)
+                for i in range(first, last)
+            ]
+            chunks.append((msg_type, int(t[first]), int(t[last - 1]), int(last - first), rows))
+    return chunks
+
+
+def _stat_chunks(msg_type, fields, starts, ends, findings):
+    t = fields["TimeUS"].astype(np.int64)
+    numeric = {
+        name: np.asarray(values, dtype=np.float64)
+        for name, values in fields.items()
+        if name != "TimeUS" and values.dtype.kind in "biuf"
+    }
+    stats = {name: window_stats(t, values, starts) for name, values in numeric.items()}
+
+    chunks = []
+    for w, (lo, hi) in enumerate(zip(starts, ends)):
+        lines, constant = [], []
+        for name, s in stats.items():
+            if s["count"][w] == 0:
+                continue
+            if s["min"][w] == s["max"][w]:
+                constant.append(f"{name}={_num(s['min'][w])}")
+                continue
+            lines.append(f"{name} min={_num(s['min'][w])} max={_num(s['max'][w])} "
+                         f"mean={_num(s['mean'][w])} slope={_num(s['slope'][w])}/s")
+            if CHUNK_LTTB_POINTS:
+                keep = lttb(t[lo:hi], numeric[name][lo:hi], CHUNK_LTTB_POINTS)
+                series = ", ".join(f"{_sec(t[lo + k])}:{_num(numeric[name][lo + k])}" for k in keep)
+                lines.append(f"  {name} series {series}")
+        if constant:
+            lines.append("constant " + " ".join(constant))
+        markers = _event_markers(findings, t[lo], t[hi - 1])
+        if markers:
+            lines.append("events " + ", ".join(markers))
+        chunks.append((msg_type, int(t[lo]), int(t[hi - 1]), int(hi - lo), lines))
+    return chunks
+
+
+def chunk_log(parsed_data, findings=None, window_s: float = CHUNK_WINDOW_S):
+    """
+    Summarise every message type per flight-time window.
+
+    Windows are aligned on TimeUS (boot time), so chunks of different
+    message types covering the same seconds share a time range. Dense
+    types become per-field min/max/mean/slope lines, with risk findings
+    overlapping the window as event markers; sparse or text messages
+    (ERR, MODE, MSG, PARM...) are listed row by row. Array fields are not
+    chunked.
+
+    Args:
+        parsed_data (dict): Parsed log in either parse mode
+        findings (list): Optional risk engine findings to mark in the chunks
+        window_s (float): Window length in seconds
+
+    Returns:
+        tuple: (chunk texts, chunk metadata dicts with msgType, startUs, endUs, samples)
+    """
+    texts, meta = [], []
+    for msg_type, fields in sorted(get_columns(parsed_data).items()):
+        fields = _scalar_fields(fields)
+        t = fields.get("TimeUS")
+        if t is None or not len(t):
+            continue
+        window = (np.asarray(t, dtype=np.int64) // int(window_s * US))
+        starts = np.concatenate(([0], np.flatnonzero(np.diff(window)) + 1))
+        ends = np.append(starts[1:], len(t))
+        if any(_is_text(values) for values in fields.values()) or len(t) <= LIST_ROWS_MAX * len(starts):
+            chunks = _row_chunks(msg_type, fields, starts, ends)
+        else:
+            chunks = _stat_chunks(msg_type, fields, starts, ends, findings)
+
+        for chunk_type, start_us, end_us, samples, lines in chunks:
+            header = f"== {chunk_type} {_sec(start_us)}-{_sec(end_us)} ({samples} samples) =="
+            texts.append("\n".join([header, *lines]))
+            meta.append({"msgType": chunk_type, "startUs": start_us, "endUs": end_us, "samples": samples})
+    return texts, meta
@@ -0,0 +1,203 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+import openai
+from metrics import metrics
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+EMBEDDING_DIM = 1536
+
+# --- Embedding Settings (override through the environment) ---
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 256))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", 4))
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite")
+EMBEDDING_CACHE_MAX_MB = float(os.getenv("EMBEDDING_CACHE_MAX_MB", 512))
+
+_embed_slots = threading.BoundedSemaphore(EMBED_CONCURRENCY)
+
+
+# --- Embedding Backends ---
+class OpenAIEmbedder:
+    """Embeds through the OpenAI API, one request per batch of texts."""
+
+    def __init__(self, model: str = EMBEDDING_MODEL, dim: int = EMBEDDING_DIM):
+        self.model = model
+        self.dim = dim
+        self.requests = 0
+
+    def embed(self, texts):
+        with _embed_slots:
+            response = openai.Embedding.create(input=texts, model=self.model)
+        self.requests += 1
+        data = sorted(response['data'], key=lambda d: d['index'])
+        return np.array([d['embedding'] for d in data], dtype=np.float32)
+
+
+class LocalEmbedder:
+    """
+    Deterministic, offline embedder for tests and benchmarks. Vectors are
+    seeded from the text hash, so equal texts embed identically but there is
+    no semantic similarity between different texts.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.model = f"local-hash-{dim}"
+        self.dim = dim
+        self.requests = 0
+
+    def embed(self, texts):
+        self.requests += 1
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "little")
+            vec = np.random.default_rng(seed).standard_normal(self.dim)
+            vectors[i] = vec / np.linalg.norm(vec)
+        return vectors
+
+
+# --- On-disk Cache ---
+class EmbeddingCache:
+    """
+    Persistent embedding cache in SQLite, keyed by sha256(model, text).
+    Least recently used rows are evicted once the stored vectors exceed max_bytes.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_bytes: float = EMBEDDING_CACHE_MAX_MB * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # shared by every uvicorn worker, readers do not block the writer
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+        self._db.commit()
+        self.bytes_used = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+
+    @staticmethod
+    def key(model: str, text: str):
+        return hashlib.sha256(f"{model}\0{text}".encode()).hexdigest()
+
+    def get_many(self, keys):
+        """Return {key: vector} for the keys present in the cache."""
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update((k, np.frombuffer(v, dtype=np.float32)) for k, v in rows)
+            if found:
+                now = time.time()
+                self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?",
+                                     [(now, k) for k in found])
+                self._db.commit()
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, items):
+        """Store (key, vector) pairs and evict old rows if over budget."""
+        now = time.time()
+        rows = [(k, np.asarray(v, dtype=np.float32).tobytes(), now) for k, v in items]
+        with self._lock:
+            # take the write lock first: other workers write to the same file,
+            # so the size is summed inside this transaction before evicting
+            self._db.execute("BEGIN IMMEDIATE")
+            self._db.executemany(
+                "INSERT OR IGNORE INTO embeddings (key, vector, size, last_used) VALUES (?, ?, ?, ?)",
+                [(key, blob, len(blob), used) for key, blob, used in rows],
+            )
+            self.bytes_used = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings").fetchone()[0]
+            self._evict()
+            self._db.commit()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "bytesUsed": self.bytes_used}
+
+    def _evict(self):
+        while self.bytes_used > self.max_bytes:
+            rows = self._db.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            doomed = []
+            for key, size in rows:
+                if self.bytes_used <= self.max_bytes:
+                    break
+                doomed.append((key,))
+                self.bytes_used -= size
+            self._db.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+
+
+_embedder = None
+_cache = None
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        _embedder = LocalEmbedder() if EMBEDDING_BACKEND == "local" else OpenAIEmbedder()
+    return _embedder
+
+
+def set_embedder(embedder):
+    """Swap the embedding backend, e.g. for a LocalEmbedder in tests and benchmarks."""
+    global _embedder
+    _embedder = embedder
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = EmbeddingCache()
+    return _cache
+
+
+def set_cache(cache):
+    global _cache
+    _cache = cache
+
+
+def embed_texts(texts):
+    """
+    Embed a list of texts, serving repeats from the on-disk cache and sending
+    the rest to the backend in batches of EMBED_BATCH_SIZE.
+
+    Returns:
+        np.ndarray: float32 array of shape (len(texts), dim)
+    """
+    embedder = get_embedder()
+    cache = get_cache()
+    keys = [EmbeddingCache.key(embedder.model, t) for t in texts]
+    vectors = cache.get_many(list(dict.fromkeys(keys)))
+
+    missing = list(dict.fromkeys(k for k in keys if k not in vectors))
+    metrics.inc("embedding_texts_total", len(keys) - len(missing), source="cache")
+    metrics.inc("embedding_texts_total", len(missing), source="backend")
+    if missing:
+        text_by_key = dict(zip(keys, texts))
+        for start in range(0, len(missing), EMBED_BATCH_SIZE):
+            batch = missing[start:start + EMBED_BATCH_SIZE]
+            with metrics.span("embed_batch"):
+                embedded = embedder.embed([text_by_key[k] for k in batch])
+            metrics.inc("embedding_requests_total")
+            vectors.update(zip(batch, embedded))
+            cache.put_many(zip(batch, embedded))
+
+    if not keys:
+        return np.empty((0, embedder.dim), dtype=np.float32)
+    return np.stack([vectors[k] for k in keys])
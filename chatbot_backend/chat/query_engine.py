@@ -0,0 +1,472 @@
+import json
+import operator
+import re
+import numpy as np
+from pymavlink import mavutil
+from chat.retrieval import time_range
+from chat.risk_engine import FlightData, GPS_MIN_SATS, US, intervals, rolling_rate
+
+# --- Flight Phase Settings ---
+# height above the first altitude sample that counts as airborne
+AIRBORNE_ALT_M = 1.0
+# vertical speed separating climb/descent from level flight
+PHASE_RATE_MS = 0.5
+PHASE_RATE_WINDOW_S = 2.0
+
+# (msg_type, field, unit) candidates tried in order for each quantity
+QUANTITIES = {
+    "altitude": [("CTUN", "Alt", "m"), ("BARO", "Alt", "m"), ("GPS", "Alt", "m")],
+    "speed": [("GPS", "Spd", "m/s")],
+    "voltage": [("BAT", "Volt", "V")],
+    "current": [("BAT", "Curr", "A")],
+    "satellites": [("GPS", "NSats", "")],
+    "hdop": [("GPS", "HDop", "")],
+    "roll": [("ATT", "Roll", "deg")],
+    "pitch": [("ATT", "Pitch", "deg")],
+    "temperature": [("BAT", "Temp", "degC"), ("BARO", "Temp", "degC")],
+}
+
+STATS = ("min", "max", "mean", "first", "last", "count")
+
+# events (loss windows, mode changes, errors) listed per tool result; "total" gives the full count
+MAX_TOOL_ITEMS = 100
+
+OPERATORS = {
+    "<": operator.lt, "<=": operator.le, ">": operator.gt,
+    ">=": operator.ge, "==": operator.eq, "!=": operator.ne,
+}
+
+# ArduPilot ERR subsystem ids (https://ardupilot.org/copter/docs/logmessages.html#err)
+ERR_SUBSYSTEMS = {
+    1: "Main", 2: "Radio", 3: "Compass", 4: "Optical flow", 5: "Radio failsafe",
+    6: "Battery failsafe", 7: "GPS failsafe", 8: "GCS failsafe", 9: "Fence failsafe",
+    10: "Flight mode", 11: "GPS", 12: "Crash check", 13: "Flip", 14: "Autotune",
+    15: "Parachute", 16: "EKF check", 17: "EKF failsafe", 18: "Barometer",
+    19: "CPU load watchdog", 20: "ADSB failsafe", 21: "Terrain data", 22: "Navigation",
+    23: "Terrain failsafe", 24: "EKF primary", 25: "Thrust loss check",
+    26: "Sensor failsafe", 27: "Leak failsafe", 28: "Pilot input", 29: "Vibration failsafe",
+}
+RADIO_SUBSYSTEMS = (2, 5)
+
+
+def _seconds(time_us):
+    return round(int(time_us) / US, 2)
+
+
+def _has_values(values):
+    return len(values) > 0 and not np.isnan(values).all()
+
+
+def _text(value):
+    return value.decode("utf-8", errors="replace") if isinstance(value, bytes) else str(value)
+
+
+class QueryEngine:
+    """
+    Exact answers to factual questions, computed from the full-resolution
+    columns. Every public method returns a JSON-serialisable dict, so the
+    same calls serve the direct route and OpenAI function calling.
+    Times are seconds since boot.
+    """
+
+    def __init__(self, parsed_data):
+        self.data = FlightData(parsed_data)
+        self.columns = self.data.columns
+
+    # --- Tools ---
+    def describe_log(self):
+        """Message types, their fields and sample counts."""
+        return {"types": {
+            msg_type: {"samples": len(fields.get("TimeUS", ())), "fields": sorted(fields)}
+            for msg_type, fields in sorted(self.columns.items())
+        }}
+
+    def aggregate(self, msg_type, field, stat):
+        """min/max/mean/first/last/count of one field, with the time of min/max/first/last."""
+        if stat not in STATS:
+            return {"error": f"stat must be one of {', '.join(STATS)}"}
+        series = self.data.series(msg_type, field)
+        if series is None:
+            return {"error": f"{msg_type}.{field} is not in this log"}
+        t, values = series
+        result = {"msgType": msg_type, "field": field, "stat": stat}
+        if stat == "count":
+            result["value"] = int(len(values))
+            return result
+        if not _has_values(values):
+            return {"error": f"{msg_type}.{field} has no valid samples in this log"}
+        if stat == "mean":
+            result["value"] = float(np.nanmean(values))
+            return result
+        if stat == "min":
+            index = np.nanargmin(values)
+        elif stat == "max":
+            index = np.nanargmax(values)
+        else:
+            index = 0 if stat == "first" else -1
+        result["value"] = float(values[index])
+        result["timeSec"] = _seconds(t[index])
+        return result
+
+    def first_occurrence(self, msg_type, field, op, value):
+        """First sample where `field op value` holds, and how many samples match."""
+        compare = OPERATORS.get(op)
+        if compare is None:
+            return {"error": f"op must be one of {', '.join(OPERATORS)}"}
+        series = self.data.series(msg_type, field)
+        if series is None:
+            return {"error": f"{msg_type}.{field} is not in this log"}
+        t, values = series
+        hits = np.flatnonzero(compare(values, float(value)))
+        result = {"msgType": msg_type, "field": field, "condition": f"{field} {op} {value}",
+                  "matches": int(len(hits))}
+        if len(hits):
+            result["timeSec"] = _seconds(t[hits[0]])
+            result["value"] = float(values[hits[0]])
+        return result
+
+    def gps_loss(self):
+        """
+        Windows without a 3D fix or with fewer than GPS_MIN_SATS satellites,
+        after the first good fix. The search for satellites after boot is
+        reported separately as the acquisition period, not as a loss.
+        """
+        status = self.data.series("GPS", "Status")
+        nsats = self.data.series("GPS", "NSats")
+        if status is None and nsats is None:
+            return {"error": "GPS is not in this log"}
+        t = (status or nsats)[0]
+        lost = np.zeros(len(t), dtype=bool)
+        if status is not None:
+            lost |= status[1] < 3
+        if nsats is not None:
+            lost |= nsats[1] < GPS_MIN_SATS
+        fixed = np.flatnonzero(~lost)
+        if not len(fixed):
+            return {"firstFixSec": None, "windows": [], "total": 0}
+        result = {"firstFixSec": _seconds(t[fixed[0]])}
+        if fixed[0] > 0:
+            result["acquisition"] = {"startSec": _seconds(t[0]), "endSec": _seconds(t[fixed[0]])}
+        lost[:fixed[0]] = False
+        starts, ends = intervals(t, lost)
+        result["windows"] = [{"startSec": _seconds(s), "endSec": _seconds(e)}
+                             for s, e in zip(starts[:MAX_TOOL_ITEMS], ends[:MAX_TOOL_ITEMS])]
+        result["total"] = int(len(starts))
+        return result
+
+    def flight_phases(self):
+        """Log length, airborne time and time spent on the ground, climbing, level and descending."""
+        # FMT and other header messages logged before the clock starts carry TimeUS 0
+        times = [t[t > 0] for t in (f.get("TimeUS") for f in self.columns.values()) if t is not None]
+        times = [t for t in times if len(t)]
+        if not times:
+            return {"error": "no timestamped messages in this log"}
+        start = min(int(t[0]) for t in times)
+        end = max(int(t[-1]) for t in times)
+        result = {"logStartSec": _seconds(start), "logEndSec": _seconds(end),
+                  "logDurationSec": _seconds(end - start)}
+
+        source = self.source("altitude")
+        if source is None:
+            return result
+        t, a = self.data.series(*source[:2])
+        dt = np.diff(t, append=t[-1]) / US
+        airborne = a - a[0] > AIRBORNE_ALT_M
+        rate = rolling_rate(t, a, PHASE_RATE_WINDOW_S)
+        climb = airborne & (rate > PHASE_RATE_MS)
+        descent = airborne & (rate < -PHASE_RATE_MS)
+        phases = {
+            "ground": ~airborne,
+            "climb": climb,
+            "level": airborne & ~climb & ~descent,
+            "descent": descent,
+        }
+        result["phasesSec"] = {name: round(float(dt[mask].sum()), 2) for name, mask in phases.items()}
+        result["airborneSec"] = round(float(dt[airborne].sum()), 2)
+        hits = np.flatnonzero(airborne)
+        if len(hits):
+            result["takeoffSec"] = _seconds(t[hits[0]])
+            result["landingSec"] = _seconds(t[hits[-1]])
+        return result
+
+    def mode_changes(self):
+        """Flight mode changes with their times and names."""
+        fields = self.columns.get("MODE", {})
+        modes = fields.get("ModeNum", fields.get("Mode"))
+        if modes is None or not len(modes):
+            return {"changes": [], "total": 0}
+        names = self._mode_names()
+        changes = [
+            {"timeSec": _seconds(t), "modeNum": int(m), "mode": names.get(int(m), str(int(m)))}
+            for t, m in zip(fields["TimeUS"][:MAX_TOOL_ITEMS], modes[:MAX_TOOL_ITEMS])
+        ]
+        return {"changes": changes, "total": int(len(modes))}
+
+    def error_events(self, subsystems=None):
+        """ERR messages with a non-zero code, optionally limited to some subsystems."""
+        fields = self.columns.get("ERR", {})
+        if "ECode" not in fields:
+            return {"errors": [], "total": 0}
+        errors = []
+        total = 0
+        subsystems_logged = fields.get("Subsys", np.zeros(len(fields["ECode"])))
+        for t, subsys, code in zip(fields["TimeUS"], subsystems_logged, fields["ECode"]):
+            if int(code) == 0 or (subsystems and int(subsys) not in subsystems):
+                continue
+            total += 1
+            if len(errors) < MAX_TOOL_ITEMS:
+                errors.append({"timeSec": _seconds(t), "subsys": int(subsys),
+                               "subsysName": ERR_SUBSYSTEMS.get(int(subsys), "Unknown"), "code": int(code)})
+        return {"errors": errors, "total": total}
+
+    def call(self, name, arguments):
+        """Run a tool by name with a JSON string or dict of arguments."""
+        if name not in TOOL_NAMES:
+            return {"error": f"unknown tool {name}"}
+        if isinstance(arguments, str):
+            try:
+                arguments = json.loads(arguments or "{}")
+            except ValueError:
+                return {"error": "arguments are not valid JSON"}
+        try:
+            return getattr(self, name)(**arguments)
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}
+
+    def _mode_names(self):
+        vehicle = " ".join(_text(m) for m in self.columns.get("MSG", {}).get("Message", ()))
+        if "ArduPlane" in vehicle:
+            return mavutil.mode_mapping_apm
+        if "Rover" in vehicle:
+            return mavutil.mode_mapping_rover
+        return mavutil.mode_mapping_acm
+
+    def source(self, quantity):
+        """(msg_type, field, unit) of the first QUANTITIES candidate present in the log."""
+        for msg_type, field, unit in QUANTITIES[quantity]:
+            series = self.data.series(msg_type, field)
+            # an all-NaN column (sensor not fitted) falls back to the next candidate
+            if series is not None and _has_values(series[1]):
+                return msg_type, field, unit
+        return None
+
+
+# --- OpenAI Function Definitions ---
+TOOLS = [
+    {
+        "name": "describe_log",
+        "description": "List the message types in the log with their fields and sample counts.",
+        "parameters": {"type": "object", "properties": {}},
+    },
+    {
+        "name": "aggregate",
+        "description": "Exact statistic of one telemetry field over the whole flight, "
+                       "with the time (seconds since boot) of the min/max/first/last sample.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "msg_type": {"type": "string", "description": "Message type, e.g. GPS, BAT, CTUN"},
+                "field": {"type": "string", "description": "Field name, e.g. Alt, Volt, NSats"},
+                "stat": {"type": "string", "enum": list(STATS)},
+            },
+            "required": ["msg_type", "field", "stat"],
+        },
+    },
+    {
+        "name": "first_occurrence",
+        "description": "First time a telemetry field satisfies a comparison, and how many samples match.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "msg_type": {"type": "string"},
+                "field": {"type": "string"},
+                "op": {"type": "string", "enum": list(OPERATORS)},
+                "value": {"type": "number"},
+            },
+            "required": ["msg_type", "field", "op", "value"],
+        },
+    },
+    {
+        "name": "gps_loss",
+        "description": "Time windows where GPS lost its 3D fix or had too few satellites after the "
+                       "first fix, plus the time of the first fix.",
+        "parameters": {"type": "object", "properties": {}},
+    },
+    {
+        "name": "flight_phases",
+        "description": "Log duration, takeoff/landing times, airborne time and time spent "
+                       "on the ground, climbing, level and descending.",
+        "parameters": {"type": "object", "properties": {}},
+    },
+    {
+        "name": "mode_changes",
+        "description": "Flight mode changes with times and mode names.",
+        "parameters": {"type": "object", "properties": {}},
+    },
+    {
+        "name": "error_events",
+        "description": "ERR messages with non-zero codes, with subsystem names.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "subsystems": {"type": "array", "items": {"type": "integer"},
+                               "description": "Only these ERR subsystem ids"},
+            },
+        },
+    },
+]
+TOOL_NAMES = {tool["name"] for tool in TOOLS}
+
+
+# --- Direct Route ---
+_STAT_WORDS = [
+    ("max", re.compile(r"\b(max(imum)?|highest|peak|top)\b")),
+    ("min", re.compile(r"\b(min(imum)?|lowest)\b")),
+    ("mean", re.compile(r"\b(average|mean|typical)\b")),
+]
+_QUANTITY_WORDS = [
+    ("altitude", re.compile(r"\b(altitude|height|alt)\b")),
+    ("speed", re.compile(r"\b(speed|velocity)\b")),
+    ("voltage", re.compile(r"\b(voltage|volts?)\b")),
+    ("current", re.compile(r"\b(current|amps?)\b")),
+    ("satellites", re.compile(r"\b(satellites?|sats|nsats)\b")),
+    ("hdop", re.compile(r"\bhdop\b")),
+    ("roll", re.compile(r"\broll\b")),
+    ("pitch", re.compile(r"\bpitch\b")),
+    ("temperature", re.compile(r"\btemp(erature)?\b")),
+]
+_DURATION = re.compile(r"\b(how long|duration|flight time|flight last)\b")
+_GPS_LOSS = re.compile(r"\bgps\b.*\b(loss|lost|drop(ped|out)?|glitch)\b|\b(loss|lost)\b.*\bgps\b")
+_MODES = re.compile(r"\b(flight )?modes?\b.*\b(change[sd]?|switch(es|ed)?|used|were)\b|\bmode changes?\b")
+_RC_LOSS = re.compile(r"\b(rc|radio)\b.*\b(drop|loss|lost|failsafe)|\b(drop|loss|lost|failsafe)\b.*\b(rc|radio)\b")
+_ERRORS = re.compile(r"\b(errors?|err)\b")
+# open-ended questions go to the model even if they mention a known quantity
+_OPEN_ENDED = re.compile(r"\b(why|explain|analy[sz]e|cause|stable|unusual|anomal\w*|recommend\w*|should)\b")
+# questions about part of the flight ("during the GPS loss", "in the last minute", "in AUTO mode",
+# "when the altitude was...") go to the model too, the direct answers cover the whole log
+_PART_OF_FLIGHT = re.compile(
+    r"\b(during|while|whilst|after|before|since|until|within|between)\b"
+    r"|\bwhen (?!(was|were|did|does|do|is)\b)"
+    r"|\b(first|last|final|past) (\d+(\.\d+)? )?(s|secs?|seconds?|mins?|minutes?|hours?)\b"
+    r"|\bin (\w+ )?mode\b"
+)
+# words a duration question may use and still be about the whole flight
+_WHOLE_FLIGHT_WORDS = {
+    "how", "long", "what", "was", "is", "did", "does", "the", "this", "that", "my", "it", "its", "of", "for",
+    "in", "up", "air", "total", "overall", "duration", "time", "flight", "log", "drone", "aircraft",
+    "vehicle", "copter", "plane", "uav", "fly", "flying", "flown", "airborne", "last", "lasted",
+    "take", "took", "stay", "stayed",
+}
+
+
+def _format_value(value, unit):
+    return f"{value:.2f} {unit}".strip()
+
+
+def answer_directly(query: str, parsed_data: dict):
+    """
+    Answer a recognised factual question from the telemetry without the LLM.
+
+    Returns:
+        str: the answer, or None if the question needs the model
+    """
+    q = query.lower()
+    if _OPEN_ENDED.search(q) or _PART_OF_FLIGHT.search(q) or time_range(q) is not None:
+        return None
+    stats = [name for name, pattern in _STAT_WORDS if pattern.search(q)]
+    quantities = [name for name, pattern in _QUANTITY_WORDS if pattern.search(q)]
+    rc_loss = _RC_LOSS.search(q)
+    intents = [intent for intent, matched in (
+        ("gps_loss", _GPS_LOSS.search(q)),
+        ("rc_loss", rc_loss),
+        ("modes", _MODES.search(q)),
+        ("duration", _DURATION.search(q)),
+        ("stat", stats and quantities),
+        # radio errors are what the RC answer lists
+        ("errors", _ERRORS.search(q) and not rc_loss),
+    ) if matched]
+    # a second intent, stat or quantity qualifies the first, which the direct answers cannot do
+    if len(intents) != 1 or len(stats) > 1 or len(quantities) > 1:
+        return None
+    intent = intents[0]
+    if quantities and intent != "stat":
+        return None
+    engine = QueryEngine(parsed_data)
+
+    if intent == "gps_loss":
+        loss = engine.gps_loss()
+        if "error" in loss:
+            return "This log has no GPS messages."
+        windows = loss["windows"]
+        if loss["firstFixSec"] is None:
+            return "GPS never got a 3D fix with enough satellites in this log."
+        if not windows:
+            return (f"GPS kept a 3D fix with enough satellites from its first fix at "
+                    f"{loss['firstFixSec']}s (time since boot) to the end of the log.")
+        first = windows[0]
+        text = f"The first GPS loss was at {first['startSec']}s and lasted until {first['endSec']}s (time since boot)."
+        if loss["total"] > 1:
+            text += f" GPS was lost {loss['total']} times in total."
+        return text
+
+    if intent == "rc_loss":
+        errors = engine.error_events(RADIO_SUBSYSTEMS)["errors"]
+        if not errors:
+            return "No radio or radio failsafe errors were logged, so there is no sign of an RC signal drop."
+        events = ", ".join(f"{e['subsysName']} code {e['code']} at {e['timeSec']}s" for e in errors)
+        return f"RC signal problems were logged: {events}."
+
+    if intent == "modes":
+        result = engine.mode_changes()
+        changes = result["changes"]
+        if not changes:
+            return "This log has no flight mode changes."
+        sequence = ", ".join(f"{c['mode']} at {c['timeSec']}s" for c in changes)
+        if result["total"] > len(changes):
+            sequence += f" and {result['total'] - len(changes)} more"
+        return f"The flight used {result['total']} mode(s): {sequence}."
+
+    if intent == "duration":
+        # "how long was the voltage below 15 V" asks about part of the flight
+        if not set(re.findall(r"[a-z]+", q)) <= _WHOLE_FLIGHT_WORDS:
+            return None
+        phases = engine.flight_phases()
+        if "error" in phases:
+            return None
+        text = f"The log covers {phases['logDurationSec']:.1f}s."
+        if phases.get("airborneSec"):
+            text += (f" The aircraft was airborne for {phases['airborneSec']:.1f}s, from takeoff at "
+                     f"{phases['takeoffSec']}s to landing at {phases['landingSec']}s.")
+            split = phases["phasesSec"]
+            text += (f" Climbing {split['climb']:.1f}s, level {split['level']:.1f}s, "
+                     f"descending {split['descent']:.1f}s.")
+        return text
+
+    if intent == "stat":
+        stat, quantity = stats[0], quantities[0]
+        source = engine.source(quantity)
+        if source is None:
+            # the quantity may be logged under other names (tlog VFR_HUD, SYS_STATUS...)
+            return None
+        msg_type, field, unit = source
+        result = engine.aggregate(msg_type, field, stat)
+        if "error" in result:
+            return None
+        label = {"max": "Maximum", "min": "Minimum", "mean": "Average"}[stat]
+        text = f"{label} {quantity} was {_format_value(result['value'], unit)} ({msg_type}.{field})"
+        if "timeSec" in result:
+            text += f" at {result['timeSec']}s (time since boot)"
+        return text + "."
+
+    if intent == "errors":
+        result = engine.error_events()
+        errors = result["errors"]
+        if not errors:
+            return "No ERR messages with a non-zero code were logged."
+        events = ", ".join(f"{e['subsysName']} (subsystem {e['subsys']}) code {e['code']} at {e['timeSec']}s"
+                           for e in errors)
+        if result["total"] > len(errors):
+            events += f" and {result['total'] - len(errors)} more"
+        return f"{result['total']} error(s) were logged: {events}."
+
+    return None
@@ -0,0 +1,183 @@
+import os
+import re
+import faiss
+import numpy as np
+from chat.chunker import CHUNK_WINDOW_S, US
+
+# --- Retrieval Settings (override through the environment) ---
+# sessions with more chunks than this are searched with an HNSW graph instead of exhaustively
+HNSW_MIN_CHUNKS = int(os.getenv("HNSW_MIN_CHUNKS", 20000))
+HNSW_M = int(os.getenv("HNSW_M", 32))
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", 128))
+HNSW_EF_CONSTRUCTION = 80
+# candidates fetched per requested chunk before reranking
+RERANK_POOL = int(os.getenv("RERANK_POOL", 3))
+# similarity bonus for a chunk whose time window touches an already selected one
+RERANK_ADJACENCY_WEIGHT = float(os.getenv("RERANK_ADJACENCY_WEIGHT", 0.05))
+# a question about one moment ("at 120s") searches this far either side of it
+TIME_PAD_S = CHUNK_WINDOW_S / 2
+
+# bump when the index metric or layout changes, stored indexes are keyed on it
+INDEX_VERSION = "ip1"
+
+# words that point at message types, beyond the type names themselves
+TOPIC_TYPES = [
+    (re.compile(r"\b(battery|batt?|volt(age|s)?|current|amps?|power)\b"), {"BAT", "CURR", "POWR"}),
+    (re.compile(r"\b(gps|satellites?|sats|hdop|fix|position)\b"), {"GPS", "GPA", "POS"}),
+    (re.compile(r"\b(altitude|height|climb|descent|baro)\b"), {"CTUN", "BARO", "GPS", "POS"}),
+    (re.compile(r"\b(attitude|roll|pitch|yaw|heading)\b"), {"ATT"}),
+    (re.compile(r"\b(vibration|vibe|clipping)\b"), {"VIBE"}),
+    (re.compile(r"\b(errors?|failsafe)\b"), {"ERR"}),
+    (re.compile(r"\b(modes?)\b"), {"MODE"}),
+    (re.compile(r"\b(rc|radio|throttle|sticks?)\b"), {"RCIN", "RCOU"}),
+    (re.compile(r"\b(compass|mag(netometer)?)\b"), {"MAG"}),
+    (re.compile(r"\b(parameters?|params?)\b"), {"PARM"}),
+    (re.compile(r"\b(messages?|statustext)\b"), {"MSG"}),
+]
+
+_NUMBER = r"(\d+(?:\.\d+)?)"
+# "m" is left out on purpose, it is metres far more often than minutes
+_UNIT = r"\s*(s|secs?|seconds?|mins?|minutes?)\b"
+_BETWEEN = re.compile(rf"\b(?:between|from)\s+{_NUMBER}(?:{_UNIT})?\s+(?:and|to)\s+{_NUMBER}{_UNIT}")
+_RANGE = re.compile(rf"\b{_NUMBER}\s*-\s*{_NUMBER}{_UNIT}")
+_AFTER = re.compile(rf"\b(?:after|since)\s+{_NUMBER}{_UNIT}")
+_BEFORE = re.compile(rf"\b(?:before|until)\s+{_NUMBER}{_UNIT}")
+_AT = re.compile(rf"\b(?:at|around|near)\s+{_NUMBER}{_UNIT}")
+
+
+def _seconds(value, unit):
+    return float(value) * (60 if unit and unit.startswith("m") else 1)
+
+
+def time_range(query: str):
+    """
+    Flight-time range (microseconds since boot) a question refers to, or
+    None. Understands "between 100 and 200s", "120-180 s", "after 5 min",
+    "before 90s" and "at 2 minutes".
+    """
+    q = query.lower()
+    if m := _BETWEEN.search(q):
+        end_unit = m.group(4)
+        lo, hi = _seconds(m.group(1), m.group(2) or end_unit), _seconds(m.group(3), end_unit)
+    elif m := _RANGE.search(q):
+        lo, hi = _seconds(m.group(1), m.group(3)), _seconds(m.group(2), m.group(3))
+    elif m := _AFTER.search(q):
+        lo, hi = _seconds(m.group(1), m.group(2)), float("inf")
+    elif m := _BEFORE.search(q):
+        lo, hi = 0.0, _seconds(m.group(1), m.group(2))
+    elif m := _AT.search(q):
+        at = _seconds(m.group(1), m.group(2))
+        lo, hi = at - TIME_PAD_S, at + TIME_PAD_S
+    else:
+        return None
+    lo, hi = min(lo, hi), max(lo, hi)
+    return max(lo, 0.0) * US, hi * US
+
+
+def message_types(query: str, columns=None):
+    """
+    Message types a question refers to: type names as logged (GPS, BAT,
+    RATE), field names (NSats, Volt) and topic words (battery, attitude).
+    Returns None if it names none.
+
+    Args:
+        query (str): The question
+        columns (Mapping): Optional {msg_type: {field: ...}} of the log, for field names
+    """
+    types = set()
+    q = query.lower()
+    for pattern, topic_types in TOPIC_TYPES:
+        if pattern.search(q):
+            types |= topic_types
+    words = set(re.findall(r"[A-Za-z][A-Za-z0-9_]+", query))
+    for msg_type, fields in (columns or {}).items():
+        if msg_type in words or any(len(f) >= 3 and f in words for f in fields):
+            types.add(msg_type)
+    return types or None
+
+
+def matching_chunks(chunk_types, starts, ends, types=None, span=None):
+    """
+    Ids of the chunks of the given types overlapping the time span, or
+    None if nothing filters.
+
+    Args:
+        chunk_types, starts, ends (np.ndarray): msgType, startUs and endUs of every chunk
+    """
+    if types is None and span is None:
+        return None
+    keep = np.ones(len(chunk_types), dtype=bool)
+    if types is not None:
+        keep &= np.isin(chunk_types, list(types))
+    if span is not None:
+        keep &= (starts <= span[1]) & (ends >= span[0])
+    return np.flatnonzero(keep).astype(np.int64)
+
+
+# --- Indexes ---
+def new_index(dim: int, size: int):
+    """Inner-product index (cosine on normalised vectors), HNSW above HNSW_MIN_CHUNKS chunks."""
+    if size > HNSW_MIN_CHUNKS:
+        index = faiss.IndexHNSWFlat(dim, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
+    return faiss.IndexFlatIP(dim)
+
+
+def normalized(vectors):
+    vectors = np.array(vectors, dtype=np.float32, ndmin=2)
+    faiss.normalize_L2(vectors)
+    return vectors
+
+
+def search(index, query_vector, k: int, ids=None):
+    """
+    Top-k (similarities, ids) for one normalised query vector, restricted to
+    ids if given. Filtered searches are always exact: a graph walk limited
+    to a subset of the nodes misses most of it, so on HNSW they scan the
+    flat vector storage under the graph instead.
+    """
+    query = query_vector.reshape(1, -1)
+    graph = isinstance(index, faiss.IndexHNSWFlat)
+    if ids is not None:
+        if graph:
+            index = faiss.downcast_index(index.storage)
+        selector = faiss.IDSelectorBatch(ids)
+        params = faiss.SearchParameters(sel=selector)
+    elif graph:
+        params = faiss.SearchParametersHNSW(efSearch=max(HNSW_EF_SEARCH, k))
+    else:
+        params = None
+    scores, found = index.search(query, k, params=params)
+    keep = found[0] >= 0
+    return scores[0][keep], found[0][keep]
+
+
+# --- Reranking ---
+def _adjacent(a, b, gap_us):
+    return a.get("startUs", 0) <= b.get("endUs", 0) + gap_us and b.get("startUs", 0) <= a.get("endUs", 0) + gap_us
+
+
+def rerank_adjacent(scores, ids, meta, top_k: int, weight: float = RERANK_ADJACENCY_WEIGHT):
+    """
+    Pick top_k of the candidates greedily: each pick maximises similarity
+    plus a bonus if its time window touches a window already picked, so
+    related message types around the same moment (a current surge and the
+    altitude loss after it) come back together instead of the same type
+    from unrelated minutes.
+
+    Returns:
+        list: (similarity, chunk id) in pick order
+    """
+    gap_us = CHUNK_WINDOW_S * US
+    remaining = list(zip(scores.tolist(), ids.tolist()))
+    picked = []
+    while remaining and len(picked) < top_k:
+        def gain(candidate):
+            score, i = candidate
+            near = any(_adjacent(meta[i], meta[j], gap_us) for _, j in picked)
+            return score + (weight if near else 0.0)
+        best = max(remaining, key=gain)
+        remaining.remove(best)
+        picked.append(best)
+    return picked
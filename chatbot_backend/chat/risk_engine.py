@@ -0,0 +1,238 @@
+import numpy as np
+from telemetry_parser.mavlog_parser import get_columns
+
+# --- Detector Thresholds ---
+GPS_MIN_SATS = 5
+GPS_MAX_HDOP = 3.0
+VOLT_DROP_V = 1.5
+VOLT_DROP_WINDOW_S = 2.0
+ALT_JUMP_M = 10.0
+ALT_JUMP_WINDOW_S = 1.0
+CURRENT_SURGE_RATIO = 2.0
+CURRENT_BASELINE_WINDOW_S = 30.0
+SURGE_SINK_RATE_MS = 2.0
+SINK_RATE_WINDOW_S = 1.0
+
+# windows closer together than this are reported as one
+MERGE_GAP_S = 1.0
+# time windows listed per finding in the details text, and kept in the result
+MAX_LISTED_WINDOWS = 3
+MAX_REPORTED_WINDOWS = 100
+
+US = 1_000_000
+
+
+# --- Column Access ---
+class FlightData:
+    """
+    Float64 views of the parsed columns, paired with their TimeUS axis.
+    Conversions are cached so detectors can share series cheaply.
+    """
+
+    def __init__(self, parsed_data):
+        self.columns = get_columns(parsed_data)
+        self._cache = {}
+
+    def series(self, msg_type, field):
+        """
+        Returns:
+            tuple: (TimeUS as int64, values as float64), or None if the field is missing
+        """
+        key = (msg_type, field)
+        if key not in self._cache:
+            self._cache[key] = self._load(msg_type, field)
+        return self._cache[key]
+
+    def _load(self, msg_type, field):
+        fields = self.columns.get(msg_type, {})
+        values = fields.get(field)
+        time_us = fields.get("TimeUS")
+        if values is None or time_us is None or values.dtype == object or not len(values):
+            return None
+        # searchsorted needs a non-decreasing axis; clamp any clock step backwards
+        t = np.maximum.accumulate(np.asarray(time_us, dtype=np.int64))
+        return t, np.asarray(values, dtype=np.float64)
+
+
+# --- Vectorized Window Helpers ---
+def window_start(t, window_s):
+    """Index of the first sample inside the trailing window ending at each sample."""
+    return np.searchsorted(t, t - int(window_s * US), side="left")
+
+
+def rolling_change(t, values, window_s):
+    """Change of each sample against the oldest sample of its trailing window."""
+    return values - values[window_start(t, window_s)]
+
+
+def rolling_rate(t, values, window_s):
+    """Rate of change per second over the trailing window (0 where the window is empty)."""
+    start = window_start(t, window_s)
+    dt = (t - t[start]) / US
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = (values - values[start]) / dt
+    return np.where(dt > 0, rate, 0.0)
+
+
+def rolling_mean(t, values, window_s):
+    """Mean of the trailing window, in O(n) through a cumulative sum."""
+    start = window_start(t, window_s)
+    csum = np.concatenate(([0.0], np.cumsum(values)))
+    end = np.arange(1, len(values) + 1)
+    return (csum[end] - csum[start]) / (end - start)
+
+
+def align(t_src, values, t_dst):
+    """Sample-and-hold the source series onto another message type's timestamps."""
+    idx = np.searchsorted(t_src, t_dst, side="right") - 1
+    return values[np.clip(idx, 0, len(values) - 1)]
+
+
+def intervals(t, mask, merge_gap_s=MERGE_GAP_S):
+    """
+    Collapse a boolean mask into (start, end) TimeUS arrays of contiguous runs,
+    merging runs separated by less than merge_gap_s.
+    """
+    edges = np.diff(mask.astype(np.int8), prepend=0, append=0)
+    starts = t[np.flatnonzero(edges == 1)]
+    ends = t[np.flatnonzero(edges == -1) - 1]
+    if len(starts) > 1:
+        keep = np.concatenate(([True], starts[1:] - ends[:-1] > merge_gap_s * US))
+        starts = starts[keep]
+        ends = ends[np.concatenate((keep[1:], [True]))]
+    return starts, ends
+
+
+# --- Detector Registry ---
+DETECTORS = []
+
+
+def detector(name, weight, message):
+    """
+    Register a detector. The decorated function takes a FlightData and
+    returns (start TimeUS, end TimeUS) arrays of the windows it flagged.
+    ``message`` may use {count} for the number of windows.
+    """
+    def register(fn):
+        DETECTORS.append({"name": name, "weight": weight, "message": message, "fn": fn})
+        return fn
+    return register
+
+
+_EMPTY = (np.array([], dtype=np.int64), np.array([], dtype=np.int64))
+
+
+@detector("gps_quality", 40, "GPS signal quality issues detected (low NSats or high HDop).")
+def gps_quality(data):
+    nsats = data.series("GPS", "NSats")
+    hdop = data.series("GPS", "HDop")
+    if nsats is None and hdop is None:
+        return _EMPTY
+    t = (nsats or hdop)[0]
+    bad = np.zeros(len(t), dtype=bool)
+    if nsats is not None:
+        bad |= nsats[1] < GPS_MIN_SATS
+    if hdop is not None:
+        bad |= hdop[1] > GPS_MAX_HDOP
+    return intervals(t, bad)
+
+
+@detector("battery_sag", 30, "Significant battery voltage drop detected.")
+def battery_sag(data):
+    volt = data.series("BAT", "Volt")
+    if volt is None:
+        return _EMPTY
+    t, v = volt
+    return intervals(t, rolling_change(t, v, VOLT_DROP_WINDOW_S) < -VOLT_DROP_V)
+
+
+@detector("subsystem_errors", 50, "{count} critical error messages found in ERR logs.")
+def subsystem_errors(data):
+    ecode = data.series("ERR", "ECode")
+    if ecode is None:
+        return _EMPTY
+    t, codes = ecode
+    # every ERR message is its own finding
+    hits = t[codes != 0]
+    return hits, hits
+
+
+@detector("altitude_jump", 20, "Sudden altitude fluctuation (>10m) detected.")
+def altitude_jump(data):
+    alt = data.series("CTUN", "Alt")
+    if alt is None:
+        return _EMPTY
+    t, a = alt
+    return intervals(t, np.abs(rolling_change(t, a, ALT_JUMP_WINDOW_S)) > ALT_JUMP_M)
+
+
+@detector("surge_altitude_loss", 30, "Altitude loss during a battery current surge detected.")
+def surge_altitude_loss(data):
+    curr = data.series("BAT", "Curr")
+    alt = data.series("CTUN", "Alt") or data.series("BARO", "Alt")
+    if curr is None or alt is None:
+        return _EMPTY
+    t, c = curr
+    surge = c > CURRENT_SURGE_RATIO * rolling_mean(t, c, CURRENT_BASELINE_WINDOW_S)
+    sink = rolling_rate(alt[0], alt[1], SINK_RATE_WINDOW_S) < -SURGE_SINK_RATE_MS
+    return intervals(t, surge & align(alt[0], sink, t))
+
+
+# --- Scoring ---
+def _format_windows(starts, ends):
+    spans = [
+        f"{s / US:.1f}s" if s == e else f"{s / US:.1f}s-{e / US:.1f}s"
+        for s, e in zip(starts[:MAX_LISTED_WINDOWS], ends[:MAX_LISTED_WINDOWS])
+    ]
+    text = ", ".join(spans)
+    if len(starts) > MAX_LISTED_WINDOWS:
+        text += f" and {len(starts) - MAX_LISTED_WINDOWS} more"
+    return text
+
+
+def score_flight(parsed_data, detectors=None):
+    """
+    Run every registered detector over the full-resolution columns.
+
+    Each detector that fires adds its weight once, however many windows it
+    flagged, and reports those windows in TimeUS.
+
+    Returns:
+        dict: {"score", "riskLevel", "details", "findings"}
+    """
+    data = FlightData(parsed_data)
+    score = 0
+    details = []
+    findings = []
+    for det in detectors or DETECTORS:
+        starts, ends = det["fn"](data)
+        if not len(starts):
+            continue
+        message = det["message"].format(count=len(starts))
+        score += det["weight"]
+        details.append(f"{message} At {_format_windows(starts, ends)} (time since boot).")
+        findings.append({
+            "detector": det["name"],
+            "weight": det["weight"],
+            "message": message,
+            "count": int(len(starts)),
+            "windows": [
+                {"startUs": int(s), "endUs": int(e)}
+                for s, e in zip(starts[:MAX_REPORTED_WINDOWS], ends[:MAX_REPORTED_WINDOWS])
+            ],
+        })
+
+    # --- Risk Interpretation ---
+    if score <= 30:
+        risk_level = "Low"
+    elif score <= 60:
+        risk_level = "Moderate"
+    else:
+        risk_level = "High"
+
+    return {
+        "score": score,
+        "riskLevel": risk_level,
+        "details": details,
+        "findings": findings,
+    }
@@ -0,0 +1,113 @@
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+# --- Concurrency Limits (override through the environment) ---
+# uvicorn worker processes (uvicorn reads the same variable), each runs its own parse pool
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", 1))
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", max(1, (os.cpu_count() or 2) // WEB_CONCURRENCY - 1)))
+CHAT_WORKERS = int(os.getenv("CHAT_WORKERS", 16))
+
+_process_pool = None
+_thread_pool = None
+_manager = None
+
+
+def process_pool():
+    """Pool for CPU-bound work (log parsing, risk scoring)."""
+    global _process_pool
+    if _process_pool is None:
+        # spawn, not fork: the server process already runs threads
+        _process_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _process_pool
+
+
+def thread_pool():
+    """Bounded pool for blocking network-bound work (embedding and completion calls)."""
+    global _thread_pool
+    if _thread_pool is None:
+        _thread_pool = ThreadPoolExecutor(max_workers=CHAT_WORKERS, thread_name_prefix="chat")
+    return _thread_pool
+
+
+def shared_dict():
+    """A dict proxy that process pool workers can update, e.g. for progress reporting."""
+    global _manager
+    if _manager is None:
+        _manager = multiprocessing.get_context("spawn").Manager()
+    return _manager.dict()
+
+
+async def run_cpu(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(process_pool(), partial(fn, *args, **kwargs))
+
+
+async def run_io(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # carry context variables (e.g. the current session for metrics) into the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(thread_pool(), partial(context.run, fn, *args, **kwargs))
+
+
+async def stream_io(fn, *args, **kwargs):
+    """
+    Run a blocking generator function in the thread pool and yield its items.
+
+    Closing this async generator, e.g. when a streaming client disconnects,
+    stops the worker at its next item and closes the blocking generator.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    stop = threading.Event()
+    end = object()
+
+    def put(item, error=None):
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+        except RuntimeError:
+            # event loop already closed
+            stop.set()
+
+    def pump():
+        gen = fn(*args, **kwargs)
+        try:
+            for item in gen:
+                if stop.is_set():
+                    break
+                put(item)
+        except Exception as e:
+            put(None, e)
+        finally:
+            gen.close()
+            put(end)
+
+    loop.run_in_executor(thread_pool(), contextvars.copy_context().run, pump)
+    try:
+        while True:
+            item, error = await queue.get()
+            if error is not None:
+                raise error
+            if item is end:
+                return
+            yield item
+    finally:
+        stop.set()
+
+
+def shutdown():
+    global _process_pool, _thread_pool, _manager
+    if _process_pool is not None:
+        _process_pool.shutdown(cancel_futures=True)
+        _process_pool = None
+    if _thread_pool is not None:
+        _thread_pool.shutdown(cancel_futures=True)
+        _thread_pool = None
+    if _manager is not None:
+        _manager.shutdown()
+        _manager = None
@@ -0,0 +1,205 @@
+"""
+Fleet batch analyzer: parse and risk-score every .bin log under a directory.
+
+Logs are hashed first, so copies of the same log are analysed once and
+logs already recorded in the fleet index (from earlier runs) are skipped.
+The rest are parsed and scored across a process pool, and one combined
+report is written as JSON or CSV.
+
+    cd chatbot_backend
+    python fleet.py /data/logs --workers 8 --output report.csv
+"""
+import argparse
+import contextlib
+import csv
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from chat.agent import compute_flight_risk
+from concurrency import PARSE_WORKERS
+from telemetry_parser.mavlog_parser import parse_log_file
+
+FLEET_INDEX_PATH = os.getenv("FLEET_INDEX_PATH", "cache/fleet_index.json")
+LOG_EXTENSIONS = (".bin",)
+HASH_CHUNK_SIZE = 1024 * 1024
+
+REPORT_FIELDS = [
+    "path", "sha256", "status", "sizeBytes", "score", "riskLevel", "details",
+    "messages", "parseSec", "duplicateOf", "error",
+]
+
+
+def find_logs(root: str):
+    """Every file under root with a log extension, in a stable order."""
+    logs = []
+    for directory, _, files in os.walk(root):
+        logs.extend(os.path.join(directory, name) for name in files
+                    if name.lower().endswith(LOG_EXTENSIONS))
+    return sorted(logs)
+
+
+def file_digest(path: str):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def score_log(path: str):
+    """
+    Process pool entry point: parse and score one log. Only the small
+    result dict travels back, never the parsed columns.
+    """
+    start = time.perf_counter()
+    try:
+        # pymavlink prints every bad header it skips, keep that out of the report
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            parsed = parse_log_file(path, columnar=True)
+        if not any(parsed["summary"].values()):
+            raise ValueError("no messages could be decoded")
+        risk = compute_flight_risk(parsed)
+    except Exception as e:
+        return {"status": "error", "error": str(e), "parseSec": round(time.perf_counter() - start, 3)}
+    return {
+        "status": "scored",
+        "score": risk["score"],
+        "riskLevel": risk["riskLevel"],
+        "details": risk["details"],
+        "messages": sum(parsed["summary"].values()),
+        "parseSec": round(time.perf_counter() - start, 3),
+    }
+
+
+class FleetIndex:
+    """Results by log sha256, kept between runs so known logs are not analysed twice."""
+
+    def __init__(self, path: str = FLEET_INDEX_PATH):
+        self.path = path
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def get(self, digest: str):
+        return self.entries.get(digest)
+
+    def put(self, digest: str, result: dict):
+        self.entries[digest] = result
+
+    def save(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.entries, f)
+        os.replace(self.path + ".tmp", self.path)
+
+
+def analyze_fleet(root: str, workers: int = PARSE_WORKERS, index: FleetIndex = None, progress=None):
+    """
+    Analyse every log under root.
+
+    Args:
+        root (str): Directory scanned recursively for .bin logs
+        workers (int): Parser processes
+        index (FleetIndex): Results of earlier runs, updated in place; None to analyse everything
+        progress (callable): Optional progress(done, total) called as logs finish
+
+    Returns:
+        list: one report row per log file, in path order
+    """
+    paths = find_logs(root)
+    with ThreadPoolExecutor(max_workers=min(8, workers * 2)) as pool:
+        digests = list(pool.map(file_digest, paths))
+
+    rows = {}
+    first_path = {}
+    to_score = []
+    for path, digest in zip(paths, digests):
+        row = {"path": path, "sha256": digest, "sizeBytes": os.path.getsize(path)}
+        if digest in first_path:
+            row.update(status="duplicate", duplicateOf=first_path[digest])
+        elif index is not None and index.get(digest) is not None:
+            row.update(index.get(digest), status="seen")
+        else:
+            to_score.append(path)
+        first_path.setdefault(digest, path)
+        rows[path] = row
+
+    # spawn, not fork, to match the server's process pool
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(score_log, path): path for path in to_score}
+        for done, future in enumerate(as_completed(futures), 1):
+            path = futures[future]
+            result = future.result()
+            rows[path].update(result)
+            if index is not None and result["status"] == "scored":
+                index.put(rows[path]["sha256"], result)
+            if progress is not None:
+                progress(done, len(futures))
+
+    for row in rows.values():
+        # duplicates report the result of the copy that was analysed
+        if row["status"] == "duplicate":
+            original = rows[row["duplicateOf"]]
+            row.update({k: original.get(k) for k in ("score", "riskLevel", "details", "messages")})
+    return [rows[path] for path in paths]
+
+
+def write_report(rows, path: str):
+    """Write rows as CSV if path ends in .csv, else JSON; '-' writes JSON to stdout."""
+    if path.endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            for row in rows:
+                writer.writerow({**row, "details": "; ".join(row.get("details") or [])})
+        return
+    report = {
+        "generatedAt": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "logs": len(rows),
+        "byRiskLevel": {
+            level: sum(1 for r in rows if r.get("riskLevel") == level)
+            for level in ("Low", "Moderate", "High")
+        },
+        "errors": sum(1 for r in rows if r["status"] == "error"),
+        "results": rows,
+    }
+    if path == "-":
+        json.dump(report, sys.stdout, indent=2)
+        return
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("root", help="directory scanned recursively for .bin logs")
+    parser.add_argument("--workers", type=int, default=PARSE_WORKERS)
+    parser.add_argument("--output", default="fleet_report.json", help="report path (.json or .csv, - for stdout)")
+    parser.add_argument("--index", default=FLEET_INDEX_PATH, help="results of earlier runs, by log hash")
+    parser.add_argument("--no-index", action="store_true", help="analyse every log, ignoring earlier runs")
+    args = parser.parse_args()
+
+    index = None if args.no_index else FleetIndex(args.index)
+    start = time.perf_counter()
+    rows = analyze_fleet(args.root, args.workers, index,
+                         progress=lambda done, total: print(f"\r{done}/{total} logs analysed", end="", file=sys.stderr))
+    if index is not None:
+        index.save()
+    write_report(rows, args.output)
+
+    counts = {status: sum(1 for r in rows if r["status"] == status)
+              for status in ("scored", "seen", "duplicate", "error")}
+    print(f"\n{len(rows)} logs in {time.perf_counter() - start:.1f}s: "
+          + ", ".join(f"{n} {status}" for status, n in counts.items()), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+import time
+from chat.agent import compute_flight_risk
+from telemetry_parser.log_store import LogStore
+from telemetry_parser.mavlog_parser import parse_log_file
+
+
+def parse_and_score(filepath: str, progress_state=None):
+    """
+    Process pool entry point: parse a log and score it in the same worker,
+    so the parsed arrays never have to be shipped back for risk scoring.
+
+    Args:
+        filepath (str): Path to the uploaded .bin file
+        progress_state (dict): Optional (shared) dict updated with bytes/messages decoded
+
+    Returns:
+        tuple: (columnar parsed data, risk result)
+    """
+    def report(bytes_decoded, messages_decoded):
+        progress_state.update(bytesDecoded=bytes_decoded, messagesDecoded=messages_decoded)
+
+    parsed = parse_log_file(filepath, columnar=True,
+                            progress_callback=report if progress_state is not None else None)
+    return parsed, compute_flight_risk(parsed)
+
+
+def parse_and_store(filepath: str, digest: str, store_root: str, progress_state=None):
+    """
+    Process pool entry point: parse and score a log, then write the result
+    to the LogStore. Only the small risk dict travels back to the server,
+    which memory-maps the stored columns instead of unpickling them.
+    """
+    parsed, risk = parse_and_score(filepath, progress_state)
+    LogStore(store_root).save(digest, parsed, risk)
+    return risk
+
+
+class ParseJob:
+    """
+    Tracks one uploaded log from the first received byte to a finished parse.
+
+    States: "uploading" -> "parsing" -> "done" | "error".
+    """
+
+    def __init__(self, session_id: str, filepath: str):
+        self.session_id = session_id
+        self.filepath = filepath
+        self.state = "uploading"
+        self.bytes_total = 0
+        # replaced by a shared dict when the parse runs in another process
+        self.progress_state = {}
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        # True when the upload matched a log that was already parsed
+        self.cached = False
+
+    @property
+    def done(self):
+        return self.state in ("done", "error")
+
+    @property
+    def bytes_decoded(self):
+        return self.progress_state.get("bytesDecoded", 0)
+
+    @property
+    def messages_decoded(self):
+        return self.progress_state.get("messagesDecoded", 0)
+
+    def start(self, bytes_total: int):
+        self.bytes_total = bytes_total
+        self.state = "parsing"
+        self.started_at = time.time()
+
+    def finish(self):
+        # detach from the shared dict so the manager can release it
+        self.progress_state = {**dict(self.progress_state), "bytesDecoded": self.bytes_total}
+        self.state = "done"
+        self.finished_at = time.time()
+
+    def fail(self, error: Exception):
+        self.progress_state = dict(self.progress_state)
+        self.error = str(error)
+        self.state = "error"
+        self.finished_at = time.time()
+
+    def status(self):
+        elapsed = 0.0
+        if self.started_at is not None:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        bytes_decoded = self.bytes_decoded
+        messages_decoded = self.messages_decoded
+        percent = 100.0 * bytes_decoded / self.bytes_total if self.bytes_total else 0.0
+        return {
+            "sessionNum": self.session_id,
+            "state": self.state,
+            "done": self.done,
+            "bytesTotal": self.bytes_total,
+            "bytesDecoded": bytes_decoded,
+            "percent": round(percent, 1),
+            "messagesDecoded": messages_decoded,
+            "messagesPerSec": round(messages_decoded / elapsed, 1) if elapsed > 0 else 0.0,
+            "elapsedSec": round(elapsed, 2),
+            "cached": self.cached,
+            "error": self.error,
+        }
+
+
+class StoredJob:
+    """
+    Read-only view of a parse running in another worker process, built from
+    the status that worker last published to the session backend.
+    """
+
+    def __init__(self, status: dict):
+        self._status = status
+        self.session_id = status["sessionNum"]
+        self.state = status["state"]
+        self.error = status.get("error")
+        self.cached = status.get("cached", False)
+
+    @property
+    def done(self):
+        return self.state in ("done", "error")
+
+    def status(self):
+        return dict(self._status)
@@ -2,17 +2,51 @@ from dotenv import load_dotenv
 import os
 
 load_dotenv()
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from chat.agent import chat_with_log, compute_flight_risk
-from telemetry_parser.mavlog_parser import parse_log_file
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from chat.agent import (chat_with_log, stream_chat_with_log, compute_flight_risk, build_vector_store,
+                        VectorStore, vector_store_key)
+from chat.answer_cache import get_answer_cache
+from chat.query_engine import answer_directly
+from jobs import ParseJob, parse_and_store
+from concurrency import run_cpu, run_io, stream_io, shared_dict, shutdown
+from chat.embeddings import get_cache
+from metrics import metrics, session_scope
+from sessions import Session, SessionStore
+from telemetry_parser.log_store import LogStore
+import asyncio
+import hashlib
+import json
+import logging
 import uuid
-from collections import defaultdict
+from contextlib import asynccontextmanager
 
-print("Loaded API key:", os.getenv("OPENAI_API_KEY"))
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper(),
+                    format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+logger = logging.getLogger("uavlog")
+logger.info("OpenAI API key %s", "set" if os.getenv("OPENAI_API_KEY") else "missing")
 
-app = FastAPI()
-session_cache = {} 
+# parsed logs and vector indexes by sha256 of the uploaded file
+log_store = LogStore()
+
+# session_id => Session (parsed log, vector index, upload file) resident in this worker, over
+# the SESSION_BACKEND that holds every session's record and chat history for all workers
+sessions = SessionStore(load_log=log_store.load)
+
+# sha256 => (ParseJob, asyncio.Task) for parses still running
+parses_in_flight = {}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    sweeper = asyncio.create_task(sessions.run_sweeper())
+    yield
+    sweeper.cancel()
+    shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,58 +56,305 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# session_id => list of messages
-chat_histories = {}  
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# how often a running parse's progress is published for /status requests other workers serve
+STATUS_PUBLISH_SECONDS = 1.0
+
+
+async def parse_into_store(job: ParseJob, digest: str):
+    job.progress_state = shared_dict()
+    try:
+        await run_cpu(parse_and_store, job.filepath, digest, log_store.root, job.progress_state)
+        loaded = log_store.load(digest)
+        if loaded is None:
+            raise RuntimeError("parsed log missing from the log store")
+    except Exception as e:
+        job.fail(e)
+        raise
+    finally:
+        parses_in_flight.pop(digest, None)
+        try:
+            os.remove(job.filepath)
+        except FileNotFoundError:
+            pass
+    job.finish()
+    record_parse(job)
+    return loaded
+
+
+def record_parse(job: ParseJob):
+    elapsed = job.finished_at - job.started_at
+    with session_scope(job.session_id):
+        metrics.observe("parse", elapsed)
+        metrics.inc("bytes_parsed_total", job.bytes_total)
+        metrics.inc("messages_decoded_total", job.messages_decoded)
+        if elapsed > 0:
+            metrics.set("parse_messages_per_second", job.messages_decoded / elapsed)
+    logger.info("parsed %s: %d bytes, %d messages in %.2fs",
+                job.session_id, job.bytes_total, job.messages_decoded, elapsed)
+
+
+async def attach_parsed_log(session: Session, task: asyncio.Task):
+    while not task.done():
+        sessions.publish(session)
+        await asyncio.wait([task], timeout=STATUS_PUBLISH_SECONDS)
+    try:
+        session.parsed, session.risk = await task
+    except Exception:
+        return
+    finally:
+        sessions.publish(session)
+    sessions.sweep()
 
 
-session_logs = {}
+def load_or_build_vector_store(session: Session):
+    index_path, chunks_path = log_store.index_paths(session.digest, vector_store_key())
+    store = VectorStore.load(index_path, chunks_path)
+    if store is None:
+        findings = (session.risk or {}).get("findings")
+        store = build_vector_store(session.parsed, findings)
+        try:
+            store.save(index_path, chunks_path)
+        except OSError:
+            pass
+    return store
+
+
+def job_status(session: Session):
+    # the job may be shared with other sessions uploading the same log
+    return {**session.job.status(), "sessionNum": session.session_id}
+
+
+def get_session(sessionNum: str):
+    session = sessions.get(sessionNum)
+    if session is None:
+        raise HTTPException(status_code=400, detail="Invalid or expired session ID")
+    return session
+
+
+def still_parsing(session: Session):
+    """Return a 202 response while the session's log is being parsed, else None."""
+    job = session.job
+    if session.parsed is not None:
+        return None
+    if job.state == "error":
+        raise HTTPException(status_code=422, detail=f"Log could not be parsed: {job.error}")
+    status = job_status(session)
+    return JSONResponse(status_code=202, content={
+        **status,
+        "response": f"The log is still being parsed ({status['percent']}%). Please try again shortly.",
+    })
+
 
 @app.post("/upload")
-async def upload_log(file: UploadFile = File(...)):
-    contents = await file.read()
+async def upload_log(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     session_id = str(uuid.uuid4())
     filepath = f"tmp/{session_id}.bin"
     os.makedirs("tmp", exist_ok=True)
+    job = ParseJob(session_id, filepath)
+    session = sessions.add(Session(session_id, filepath, job))
+
+    size = 0
+    sha = hashlib.sha256()
     with open(filepath, "wb") as f:
-        f.write(contents)
-    parsed_data = parse_log_file(filepath)
-    session_logs[session_id] = parsed_data
-    chat_histories[session_id] = []
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            f.write(chunk)
+            sha.update(chunk)
+            size += len(chunk)
+    session.digest = digest = sha.hexdigest()
+
+    if digest in parses_in_flight:
+        # same log is being parsed for another session, share that job
+        os.remove(filepath)
+        session.job, task = parses_in_flight[digest]
+        background_tasks.add_task(attach_parsed_log, session, task)
+        message = "Log uploaded, joined the parse already in progress."
+    elif (loaded := log_store.load(digest)) is not None:
+        os.remove(filepath)
+        session.parsed, session.risk = loaded
+        job.cached = True
+        job.start(size)
+        job.finish()
+        message = "Log already parsed, attached to the stored result."
+    else:
+        job.start(size)
+        task = asyncio.create_task(parse_into_store(job, digest))
+        parses_in_flight[digest] = (job, task)
+        background_tasks.add_task(attach_parsed_log, session, task)
+        message = "Log uploaded, parsing started."
+    sessions.publish(session)
+
+    return {"sessionNum": session_id, "message": message, "status": job_status(session)}
+
 
-    return {"sessionNum": session_id, "message": "Log parsed successfully."}
+@app.get("/status/{sessionNum}")
+async def parse_status(sessionNum: str):
+    session = sessions.get(sessionNum)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Invalid or expired session ID")
+    return job_status(session)
+
+
+@app.get("/sessions/stats")
+async def session_stats():
+    return sessions.stats()
 
 
 @app.post("/chat")
 async def chat(sessionNum: str = Form(...), query: str = Form(...)):
-    parsed = session_logs.get(sessionNum)
-    if not parsed:
-        raise HTTPException(status_code=400, detail="Invalid or expired session ID")
+    with session_scope(sessionNum), metrics.span("chat"):
+        return await _chat(sessionNum, query)
+
+
+async def _chat(sessionNum: str, query: str):
+    session = get_session(sessionNum)
+    pending = still_parsing(session)
+    if pending is not None:
+        return pending
+    parsed = session.parsed
+
+    # Factual questions the query engine recognises skip retrieval and the LLM
+    answer = await run_io(answer_directly, query, parsed)
+    if answer is not None:
+        session.add_exchange(query, answer)
+        metrics.inc("chat_requests_total", route="fast_path")
+        return {"response": answer, "sessionNum": sessionNum, "fastPath": True, "cached": False}
 
-    history = chat_histories.setdefault(sessionNum, [])
+    trimmed_history = session.history(2)
 
-    trimmed_history = history[-2:]
-    
-    # print(f"Session: {sessionNum}")
-    # print(f"Chat history so far: {trimmed_history}")
+    # the same question, or a close paraphrase, already answered for this log
+    cached = await run_io(get_answer_cache().get, session.digest, query, trimmed_history)
+    if cached is not None:
+        session.add_exchange(query, cached[0])
+        metrics.inc("chat_requests_total", route="cache")
+        return {"response": cached[0], "sessionNum": sessionNum, "fastPath": False, "cached": True}
+
+    async with session.lock:
+        if session.vector_store is None:
+            session.vector_store = await run_io(load_or_build_vector_store, session)
+
+    metrics.inc("chat_requests_total", route="llm")
 
     messages = trimmed_history  + [{"role": "user", "content": query}]
 
-    response_text = chat_with_log(query, parsed, messages)
-    history.append({"role": "user", "content": query})
-    history.append({"role": "assistant", "content": response_text})
+    response_text = await run_io(chat_with_log, query, parsed, messages, session.vector_store)
+    if not response_text.startswith("Error:"):
+        await run_io(get_answer_cache().put, session.digest, query, response_text, trimmed_history)
+    session.add_exchange(query, response_text)
+    sessions.sweep()
 
     return {
         "response": response_text,
-        "sessionNum": sessionNum
+        "sessionNum": sessionNum,
+        "fastPath": False,
+        "cached": False
     }
 
 
+def sse(event: str, data: dict):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_stream(sessionNum: str = Form(...), query: str = Form(...)):
+    """
+    Same as /chat, but streams the answer as Server-Sent Events: "token"
+    events carry text as the model produces it and a final "done" event
+    closes the stream, or an "error" event if the answer failed part way.
+    A cached answer arrives as a single token. The exchange is added to the
+    chat history only once the answer is complete; a client disconnect
+    cancels the upstream call.
+    """
+    with session_scope(sessionNum):
+        return await _chat_stream(sessionNum, query)
+
+
+async def _chat_stream(sessionNum: str, query: str):
+    session = get_session(sessionNum)
+    pending = still_parsing(session)
+    if pending is not None:
+        return pending
+    parsed = session.parsed
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+    answer = await run_io(answer_directly, query, parsed)
+    if answer is not None:
+        session.add_exchange(query, answer)
+        metrics.inc("chat_requests_total", route="fast_path")
+
+        async def fast_path_events():
+            yield sse("token", {"text": answer})
+            yield sse("done", {"sessionNum": sessionNum, "fastPath": True, "cached": False})
+
+        return StreamingResponse(fast_path_events(), media_type="text/event-stream", headers=headers)
+
+    context = session.history(2)
+    cached = await run_io(get_answer_cache().get, session.digest, query, context)
+    if cached is not None:
+        session.add_exchange(query, cached[0])
+        metrics.inc("chat_requests_total", route="cache")
+
+        async def cached_events():
+            yield sse("token", {"text": cached[0]})
+            yield sse("done", {"sessionNum": sessionNum, "fastPath": False, "cached": True})
+
+        return StreamingResponse(cached_events(), media_type="text/event-stream", headers=headers)
+
+    async with session.lock:
+        if session.vector_store is None:
+            session.vector_store = await run_io(load_or_build_vector_store, session)
+
+    messages = context + [{"role": "user", "content": query}]
+    metrics.inc("chat_requests_total", route="stream")
+
+    async def events():
+        parts = []
+        # the response body runs after the handler returns, outside its session scope
+        with session_scope(sessionNum), metrics.span("chat_stream"):
+            tokens = stream_io(stream_chat_with_log, query, parsed, messages, session.vector_store)
+            try:
+                async for text in tokens:
+                    parts.append(text)
+                    yield sse("token", {"text": text})
+            except Exception as e:
+                # a partial answer is neither kept in the history nor cached
+                logger.warning("stream for %s failed: %s", sessionNum, e)
+                yield sse("error", {"sessionNum": sessionNum, "message": f"Error: {e}"})
+                return
+            finally:
+                # contextlib.aclosing needs Python 3.10
+                await tokens.aclose()
+        answer = "".join(parts)
+        await run_io(get_answer_cache().put, session.digest, query, answer, context)
+        session.add_exchange(query, answer)
+        sessions.sweep()
+        yield sse("done", {"sessionNum": sessionNum, "fastPath": False, "cached": False})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=headers)
+
+
 @app.post("/risk_score")
 async def risk_score(sessionNum: str = Form(...)):
-    parsed = session_logs.get(sessionNum)
-    if not parsed:
+    session = sessions.get(sessionNum)
+    if session is None:
         return {"error": "Invalid session number"}
-    risk = compute_flight_risk(parsed)
-    return risk
+    pending = still_parsing(session)
+    if pending is not None:
+        return pending
+    if session.risk is None:
+        with session_scope(sessionNum), metrics.span("risk_score"):
+            session.risk = await run_cpu(compute_flight_risk, session.parsed)
+    return session.risk
 
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Counters and stage timings in the Prometheus text format, fleet-wide and per session."""
+    stats = sessions.stats()
+    metrics.set("resident_sessions", stats["residentSessions"])
+    metrics.set("session_bytes_used", stats["bytesUsed"])
+    metrics.set("embedding_cache_bytes", get_cache().stats()["bytesUsed"])
+    answers = get_answer_cache().stats()
+    metrics.set("answer_cache_entries", answers["entries"])
+    metrics.set("answer_cache_hit_ratio", answers["hitRate"])
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,180 @@
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+PREFIX = "uavlog"
+
+# upper bounds (seconds) of the stage duration histogram buckets
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+HELP = {
+    "stage_seconds": "Time spent per pipeline stage",
+    "bytes_parsed_total": "Log bytes scanned by the parser",
+    "messages_decoded_total": "Log messages indexed by the parser",
+    "parse_messages_per_second": "Indexing rate of the most recent parse",
+    "embedding_texts_total": "Texts embedded, by source (cache or backend)",
+    "embedding_requests_total": "Embedding backend calls",
+    "prompt_tokens_total": "Prompt tokens sent to the completion model",
+    "completion_tokens_total": "Completion tokens received",
+    "chat_requests_total": "Chat requests, by route (fast_path, cache, llm or stream)",
+    "tool_calls_total": "Query engine tool calls made by the model, by tool",
+    "retrieval_searches_total": "Chunk searches, by metadata filter (type, time, type+time or none)",
+    "resident_sessions": "Sessions held in memory",
+    "session_bytes_used": "Approximate memory held by resident sessions",
+    "embedding_cache_bytes": "Size of the on-disk embedding cache",
+    "answer_cache_lookups_total": "Answer cache lookups, by result (hit or miss)",
+    "answer_cache_entries": "Answers stored in the answer cache",
+    "answer_cache_hit_ratio": "Answer cache hits per lookup since the backend started",
+}
+
+# session the current request belongs to; copied into worker threads by concurrency.run_io
+current_session = contextvars.ContextVar("current_session", default=None)
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value):
+    """Label value escaped as the Prometheus text format requires."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    """
+    In-process counters, gauges and stage timings, rendered in the
+    Prometheus text format.
+
+    Every sample is recorded once fleet-wide and, when a session is
+    current, once more under a "session" label, so /metrics shows both
+    totals and per-session breakdowns. Per-session series are dropped
+    with forget_session() when a session is evicted.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._hist_buckets = defaultdict(lambda: [0] * len(SPAN_BUCKETS))
+        self._hist_sum = defaultdict(float)
+        self._hist_count = defaultdict(int)
+        self._session_sum = defaultdict(float)
+        self._session_count = defaultdict(int)
+
+    def inc(self, name: str, value: float = 1, session: str = None, **labels):
+        session = session or current_session.get()
+        with self._lock:
+            self._counters[_key(name, labels)] += value
+            if session is not None:
+                self._counters[_key(name, {**labels, "session": session})] += value
+
+    def set(self, name: str, value: float, session: str = None, **labels):
+        session = session or current_session.get()
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+            if session is not None:
+                self._gauges[_key(name, {**labels, "session": session})] = value
+
+    def observe(self, stage: str, seconds: float, session: str = None):
+        session = session or current_session.get()
+        key = _key("stage_seconds", {"stage": stage})
+        with self._lock:
+            buckets = self._hist_buckets[key]
+            for i, bound in enumerate(SPAN_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+            self._hist_sum[key] += seconds
+            self._hist_count[key] += 1
+            if session is not None:
+                session_key = _key("stage_seconds", {"stage": stage, "session": session})
+                self._session_sum[session_key] += seconds
+                self._session_count[session_key] += 1
+
+    @contextmanager
+    def span(self, stage: str):
+        """Time the enclosed block as one observation of the stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def forget_session(self, session_id: str):
+        with self._lock:
+            for store in (self._counters, self._gauges, self._session_sum, self._session_count):
+                for key in [k for k in store if ("session", session_id) in k[1]]:
+                    del store[key]
+
+    def snapshot(self):
+        """Counter totals and per-stage time sums without labels other than stage, for benchmarks."""
+        with self._lock:
+            counters = {}
+            for (name, labels), value in self._counters.items():
+                if not any(k == "session" for k, _ in labels):
+                    counters[name] = counters.get(name, 0) + value
+            stages = {dict(labels)["stage"]: {"count": self._hist_count[(name, labels)], "sum": total}
+                      for (name, labels), total in self._hist_sum.items()}
+        return {"counters": counters, "stages": stages}
+
+    def render(self):
+        with self._lock:
+            lines = []
+            seen = set()
+
+            def header(name, kind):
+                if name not in seen:
+                    seen.add(name)
+                    lines.append(f"# HELP {PREFIX}_{name} {HELP.get(name, name)}")
+                    lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+            for (name, labels), value in sorted(self._counters.items()):
+                header(name, "counter")
+                lines.append(f"{PREFIX}_{name}{_format_labels(labels)} {_format_value(value)}")
+            for (name, labels), value in sorted(self._gauges.items()):
+                header(name, "gauge")
+                lines.append(f"{PREFIX}_{name}{_format_labels(labels)} {_format_value(value)}")
+
+            for key in sorted(self._hist_count):
+                name, labels = key
+                header(name, "histogram")
+                for bound, count in zip(SPAN_BUCKETS, self._hist_buckets[key]):
+                    lines.append(f"{PREFIX}_{name}_bucket{_format_labels(labels + (('le', f'{bound:g}'),))} {count}")
+                lines.append(f"{PREFIX}_{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {self._hist_count[key]}")
+                lines.append(f"{PREFIX}_{name}_sum{_format_labels(labels)} {self._hist_sum[key]:.6f}")
+                lines.append(f"{PREFIX}_{name}_count{_format_labels(labels)} {self._hist_count[key]}")
+
+            # per-session stage times as a summary, buckets per session would be too many series
+            if self._session_count:
+                name = "session_stage_seconds"
+                lines.append(f"# HELP {PREFIX}_{name} Time spent per pipeline stage, per session")
+                lines.append(f"# TYPE {PREFIX}_{name} summary")
+                for key in sorted(self._session_count):
+                    labels = key[1]
+                    lines.append(f"{PREFIX}_{name}_sum{_format_labels(labels)} {self._session_sum[key]:.6f}")
+                    lines.append(f"{PREFIX}_{name}_count{_format_labels(labels)} {self._session_count[key]}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+@contextmanager
+def session_scope(session_id: str):
+    """Attribute metrics recorded in the enclosed block (and work it hands to run_io) to a session."""
+    token = current_session.set(session_id)
+    try:
+        yield
+    finally:
+        current_session.reset(token)
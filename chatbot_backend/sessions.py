@@ -0,0 +1,399 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from jobs import StoredJob
+from metrics import metrics
+
+# --- Session Limits (override through the environment) ---
+SESSION_MEMORY_BUDGET_MB = float(os.getenv("SESSION_MEMORY_BUDGET_MB", 2048))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", 3600))
+SESSION_SWEEP_SECONDS = float(os.getenv("SESSION_SWEEP_SECONDS", 60))
+# "memory" for a single worker, "sqlite" to share sessions between uvicorn workers on one host
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "cache/sessions.sqlite")
+
+
+def parsed_nbytes(parsed_data):
+    """Approximate resident size of a parse result (NumPy column bytes)."""
+    if not parsed_data:
+        return 0
+    columns = parsed_data.get("columns", {})
+    if hasattr(columns, "nbytes"):
+        # lazily decoded log, only the fields decoded so far are resident
+        return columns.nbytes()
+    return sum(
+        values.nbytes
+        for fields in columns.values()
+        for values in fields.values()
+    )
+
+
+# --- Session Backends ---
+class MemorySessionBackend:
+    """Session records and chat histories in this process, for a single worker."""
+
+    name = "memory"
+
+    def __init__(self):
+        self._records = {}
+        self._histories = {}
+        self._lock = threading.Lock()
+
+    def save(self, session_id: str, record: dict):
+        with self._lock:
+            self._records[session_id] = {**record, "lastUsed": time.time()}
+            self._histories.setdefault(session_id, [])
+
+    def load(self, session_id: str):
+        with self._lock:
+            record = self._records.get(session_id)
+            return None if record is None else dict(record)
+
+    def touch(self, session_id: str, now: float, ttl_seconds: float):
+        """Mark the session as used; False if it does not exist or has expired."""
+        with self._lock:
+            record = self._records.get(session_id)
+            if record is None:
+                return False
+            if now - record["lastUsed"] > ttl_seconds:
+                self._forget(session_id)
+                return False
+            record["lastUsed"] = now
+            return True
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._forget(session_id)
+
+    def expire(self, before: float):
+        """Delete sessions last used before the given time, return their ids."""
+        with self._lock:
+            expired = [sid for sid, record in self._records.items() if record["lastUsed"] < before]
+            for session_id in expired:
+                self._forget(session_id)
+        return expired
+
+    def append_history(self, session_id: str, messages: list):
+        with self._lock:
+            if session_id in self._histories:
+                self._histories[session_id].extend(messages)
+
+    def history(self, session_id: str, limit: int = None):
+        with self._lock:
+            messages = self._histories.get(session_id, [])
+            return list(messages[-limit:] if limit else messages)
+
+    def history_bytes(self, session_id: str):
+        with self._lock:
+            return sum(len(m["content"]) for m in self._histories.get(session_id, []))
+
+    def count(self):
+        return len(self._records)
+
+    def _forget(self, session_id):
+        self._records.pop(session_id, None)
+        self._histories.pop(session_id, None)
+
+
+class SQLiteSessionBackend:
+    """
+    Session records and chat histories in a SQLite database that every
+    worker process on the host opens, so any worker can serve any session.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = SESSION_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # readers in other workers do not block the writer
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, record TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id INTEGER PRIMARY KEY, session_id TEXT NOT NULL, role TEXT NOT NULL, content TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_last_used ON sessions (last_used)")
+        self._db.commit()
+
+    def save(self, session_id: str, record: dict):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO sessions (session_id, record, last_used) VALUES (?, ?, ?)",
+                             (session_id, json.dumps(record), time.time()))
+            self._db.commit()
+
+    def load(self, session_id: str):
+        with self._lock:
+            row = self._db.execute("SELECT record FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def touch(self, session_id: str, now: float, ttl_seconds: float):
+        """Mark the session as used; False if it does not exist or has expired."""
+        with self._lock:
+            updated = self._db.execute("UPDATE sessions SET last_used = ? WHERE session_id = ? AND last_used >= ?",
+                                       (now, session_id, now - ttl_seconds)).rowcount
+            self._db.commit()
+        return updated > 0
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._forget([session_id])
+            self._db.commit()
+
+    def expire(self, before: float):
+        """Delete sessions last used before the given time, return their ids."""
+        with self._lock:
+            expired = [sid for sid, in self._db.execute(
+                "SELECT session_id FROM sessions WHERE last_used < ?", (before,))]
+            self._forget(expired)
+            self._db.commit()
+        return expired
+
+    def append_history(self, session_id: str, messages: list):
+        with self._lock:
+            self._db.executemany("INSERT INTO messages (session_id, role, content) VALUES (?, ?, ?)",
+                                 [(session_id, m["role"], m["content"]) for m in messages])
+            self._db.commit()
+
+    def history(self, session_id: str, limit: int = None):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT role, content FROM messages WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+                (session_id, limit or -1),
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def history_bytes(self, session_id: str):
+        # kept on disk, not in worker memory
+        return 0
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def _forget(self, session_ids):
+        rows = [(sid,) for sid in session_ids]
+        self._db.executemany("DELETE FROM sessions WHERE session_id = ?", rows)
+        self._db.executemany("DELETE FROM messages WHERE session_id = ?", rows)
+
+
+def new_backend(name: str = SESSION_BACKEND):
+    if name == "sqlite":
+        return SQLiteSessionBackend()
+    if name == "memory":
+        return MemorySessionBackend()
+    raise ValueError(f"unknown SESSION_BACKEND {name!r}, expected memory or sqlite")
+
+
+class Session:
+    """Everything one uploaded log owns: upload file, parse, index and chat history."""
+
+    def __init__(self, session_id: str, filepath: str, job=None):
+        self.session_id = session_id
+        self.filepath = filepath
+        self.job = job
+        # sha256 of the uploaded file, keys the LogStore entry
+        self.digest = None
+        self.parsed = None
+        self.risk = None
+        self.vector_store = None
+        # chat history lives in the backend, set by SessionStore.add
+        self.backend = None
+        self.last_used = time.time()
+        # serialises the first vector store build between concurrent chats
+        self.lock = asyncio.Lock()
+
+    @property
+    def busy(self):
+        return self.job is not None and not self.job.done
+
+    def record(self):
+        """What other workers need to serve this session: the log digest and parse status."""
+        return {"digest": self.digest, "job": self.job.status() if self.job is not None else None}
+
+    def history(self, limit: int = None):
+        """The last `limit` chat messages (all if None), oldest first."""
+        return self.backend.history(self.session_id, limit)
+
+    def add_exchange(self, query: str, answer: str):
+        self.backend.append_history(self.session_id, [
+            {"role": "user", "content": query},
+            {"role": "assistant", "content": answer},
+        ])
+
+    def nbytes(self):
+        size = parsed_nbytes(self.parsed)
+        if self.vector_store is not None:
+            size += self.vector_store.nbytes()
+        if self.backend is not None:
+            size += self.backend.history_bytes(self.session_id)
+        return size
+
+    def close(self):
+        """Drop in-memory state and delete the uploaded file."""
+        self.parsed = None
+        self.vector_store = None
+        metrics.forget_session(self.session_id)
+        if self.filepath is None:
+            return
+        try:
+            os.remove(self.filepath)
+        except FileNotFoundError:
+            pass
+
+
+class SessionStore:
+    """
+    LRU registry of the sessions resident in this worker, with a memory
+    budget and an idle TTL, over a backend holding every session's record
+    and chat history.
+
+    Sessions that are still parsing are never evicted. Evicted sessions
+    release their arrays and index and delete their upload, but keep their
+    record: the next request rebuilds them from the stored parse, in this
+    worker or another one sharing the backend. Expired sessions are deleted
+    from the backend as well.
+    """
+
+    def __init__(self, max_bytes: float = SESSION_MEMORY_BUDGET_MB * 1024 * 1024,
+                 ttl_seconds: float = SESSION_TTL_SECONDS, backend=None, load_log=None):
+        """
+        Args:
+            backend: MemorySessionBackend or SQLiteSessionBackend, SESSION_BACKEND by default
+            load_log (callable): load_log(digest) -> (parsed, risk) or None, used to rebuild
+                sessions that are not resident
+        """
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend if backend is not None else new_backend()
+        self.load_log = load_log
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+        self.restores = 0
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def add(self, session: Session):
+        session.backend = self.backend
+        self.backend.save(session.session_id, session.record())
+        with self._lock:
+            self._sessions[session.session_id] = session
+        return session
+
+    def publish(self, session: Session):
+        """Store the session's current digest and parse status for other workers."""
+        self.backend.save(session.session_id, session.record())
+
+    def get(self, session_id: str):
+        """
+        Return the session and mark it as most recently used, or None.
+        A session this worker does not hold is rebuilt from its record.
+        """
+        now = time.time()
+        if not self.backend.touch(session_id, now, self.ttl_seconds):
+            with self._lock:
+                if session_id in self._sessions:
+                    self._drop(session_id)
+                    self.expirations += 1
+            return None
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.last_used = now
+                self._sessions.move_to_end(session_id)
+                return session
+        return self._restore(session_id)
+
+    def remove(self, session_id: str):
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop(session_id)
+        self.backend.delete(session_id)
+
+    def bytes_used(self):
+        with self._lock:
+            return sum(s.nbytes() for s in self._sessions.values())
+
+    def sweep(self):
+        """Expire idle sessions, then evict least recently used ones until under budget."""
+        now = time.time()
+        expired = set(self.backend.expire(now - self.ttl_seconds))
+        with self._lock:
+            for session_id, session in list(self._sessions.items()):
+                if session_id in expired or self._expired(session, now):
+                    self._drop(session_id)
+                    self.expirations += 1
+
+            sizes = {sid: s.nbytes() for sid, s in self._sessions.items()}
+            used = sum(sizes.values())
+            for session_id, session in list(self._sessions.items()):
+                if used <= self.max_bytes:
+                    break
+                if session.busy:
+                    continue
+                used -= sizes[session_id]
+                self._drop(session_id)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+        return {
+            "backend": self.backend.name,
+            "storedSessions": self.backend.count(),
+            "residentSessions": len(sessions),
+            "parsingSessions": sum(1 for s in sessions if s.busy),
+            "bytesUsed": sum(s.nbytes() for s in sessions),
+            "bytesBudget": int(self.max_bytes),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "restores": self.restores,
+        }
+
+    async def run_sweeper(self, interval: float = SESSION_SWEEP_SECONDS):
+        while True:
+            await asyncio.sleep(interval)
+            self.sweep()
+
+    def _restore(self, session_id):
+        record = self.backend.load(session_id)
+        if record is None or record.get("job") is None:
+            return None
+        session = Session(session_id, None, StoredJob(record["job"]))
+        session.digest = record["digest"]
+        session.backend = self.backend
+        if not session.job.done or session.job.state == "error":
+            # parsing in another worker, or failed: answered from the record, not kept resident
+            return session
+        loaded = self.load_log(session.digest) if self.load_log is not None else None
+        if loaded is None:
+            # the parsed log has been pruned from the store
+            return None
+        session.parsed, session.risk = loaded
+        with self._lock:
+            # another request may have rebuilt it meanwhile
+            resident = self._sessions.setdefault(session_id, session)
+            if resident is session:
+                self.restores += 1
+            self._sessions.move_to_end(session_id)
+        return resident
+
+    def _expired(self, session, now):
+        return not session.busy and now - session.last_used > self.ttl_seconds
+
+    def _drop(self, session_id):
+        self._sessions.pop(session_id).close()
@@ -0,0 +1,355 @@
+import mmap
+import os
+import struct
+import threading
+from collections.abc import Mapping
+import numpy as np
+from pymavlink.DFReader import FORMAT_TO_STRUCT
+
+HEAD = b"\xa3\x95"
+FMT_TYPE = 0x80
+FMT_LENGTH = 89
+FMT_BODY = struct.Struct("<BB4s16s64s")
+STRING_FORMATS = "nNZ"
+
+# messages between progress callbacks while scanning
+SCAN_PROGRESS_INTERVAL = 100000
+# rows gathered per step when decoding a field, bounds the temporary index array
+DECODE_BLOCK_ROWS = 65536
+
+# DataFlash format characters -> little-endian NumPy dtype of the raw value.
+# Multipliers (c, C, e, E, L) come from pymavlink's FORMAT_TO_STRUCT.
+FORMAT_DTYPES = {
+    "b": "i1", "B": "u1", "M": "i1", "h": "<i2", "H": "<u2", "i": "<i4", "I": "<u4",
+    "q": "<i8", "Q": "<u8", "f": "<f4", "g": "<f2", "d": "<f8",
+    "c": "<i2", "C": "<u2", "e": "<i4", "E": "<u4", "L": "<i4",
+    "n": "S4", "N": "S16", "Z": "S64", "a": ("<i2", (32,)),
+}
+
+
+def decode_string(value):
+    if isinstance(value, bytes):
+        try:
+            value = value.decode("utf-8")
+        except UnicodeDecodeError:
+            value = value.decode("ISO-8859-1")
+    return value.split("\0", 1)[0]
+
+
+def is_dataflash(file_path: str):
+    """True if the file starts with a DataFlash FMT record (a .bin log, not a tlog)."""
+    with open(file_path, "rb") as f:
+        return f.read(3) == HEAD + bytes([FMT_TYPE])
+
+
+def _ascii(raw):
+    return raw.split(b"\0", 1)[0].decode("ascii", errors="replace")
+
+
+class MessageFormat:
+    """Layout of one message type, from its FMT record."""
+
+    def __init__(self, type_id: int, name: str, length: int, format: str, columns: str):
+        self.type_id = type_id
+        self.name = name
+        self.length = length
+        self.format = format
+        self.columns = columns
+        names = columns.split(",") if columns else []
+        # field -> (byte offset in the payload, dtype, format character)
+        self.fields = {}
+        pos = 0
+        for i, char in enumerate(format):
+            dtype = np.dtype(FORMAT_DTYPES[char])
+            if i < len(names) and names[i] not in self.fields:
+                self.fields[names[i]] = (pos, dtype, char)
+            pos += dtype.itemsize
+        if pos + 3 != length:
+            raise ValueError(f"{name}: format {format} does not fill {length} bytes")
+
+    def to_dict(self):
+        return {"type": self.type_id, "name": self.name, "length": self.length,
+                "format": self.format, "columns": self.columns}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["type"], d["name"], d["length"], d["format"], d["columns"])
+
+
+def _read_fmt(data, ofs):
+    type_id, length, name, format, columns = FMT_BODY.unpack_from(data, ofs + 3)
+    try:
+        return MessageFormat(type_id, _ascii(name), length, _ascii(format), _ascii(columns))
+    except (KeyError, ValueError):
+        # unsupported format character or inconsistent length, its messages are skipped
+        return None
+
+
+def scan_log(data, progress_callback=None):
+    """
+    Walk a DataFlash log once, reading only message headers and FMT records.
+
+    Args:
+        data: bytes-like log contents (normally a memory map)
+        progress_callback (callable): Called as progress_callback(bytes_scanned, messages_indexed)
+
+    Returns:
+        tuple: ({name: MessageFormat}, {name: np.ndarray of message byte offsets})
+    """
+    lengths = [0] * 256
+    lengths[FMT_TYPE] = FMT_LENGTH
+    formats = {}
+    positions = [[] for _ in range(256)]
+    size = len(data)
+    ofs = 0
+    count = 0
+    while ofs + 3 <= size:
+        if data[ofs] != 0xA3 or data[ofs + 1] != 0x95:
+            ofs = data.find(HEAD, ofs + 1)
+            if ofs < 0:
+                break
+            continue
+        mtype = data[ofs + 2]
+        length = lengths[mtype]
+        if not length or ofs + length > size:
+            # no FMT for this type yet, or a message cut off at the end of the log
+            ofs = data.find(HEAD, ofs + 1)
+            if ofs < 0:
+                break
+            continue
+        if mtype == FMT_TYPE:
+            fmt = _read_fmt(data, ofs)
+            # the first definition wins, so earlier offsets keep a consistent layout
+            if fmt is not None and fmt.type_id not in formats:
+                formats[fmt.type_id] = fmt
+                lengths[fmt.type_id] = fmt.length
+        positions[mtype].append(ofs)
+        ofs += length
+        count += 1
+        if progress_callback is not None and count % SCAN_PROGRESS_INTERVAL == 0:
+            progress_callback(ofs, count)
+
+    if progress_callback is not None:
+        progress_callback(size, count)
+    formats.setdefault(FMT_TYPE, MessageFormat(FMT_TYPE, "FMT", FMT_LENGTH, "BBnNZ",
+                                               "Type,Length,Name,Format,Columns"))
+    by_name, offsets = {}, {}
+    for type_id, fmt in formats.items():
+        if positions[type_id] and fmt.name not in offsets:
+            by_name[fmt.name] = fmt
+            offsets[fmt.name] = np.array(positions[type_id], dtype=np.int64)
+    return by_name, offsets
+
+
+def field_file(msg_type: str, field: str):
+    return f"{msg_type}.{field}.npy"
+
+
+def write_field(path: str, values):
+    """Write a decoded field as .npy, renamed into place so readers never see a partial file."""
+    staging = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(staging, "wb") as f:
+            np.save(f, values)
+        os.replace(staging, path)
+    finally:
+        if os.path.exists(staging):
+            os.remove(staging)
+
+
+def _open(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class LogIndex:
+    """
+    Byte offsets of every message in a memory-mapped DataFlash log, by type.
+
+    Nothing is decoded up front: a field is decoded for all messages of
+    its type the first time it is asked for (one vectorised gather over
+    the offsets) and kept. Values match what parse_log_columns produces.
+
+    With a field_dir, decoded fields are also written there as .npy files
+    and memory-mapped back, so every process indexing the same stored log
+    shares one copy through the page cache and decodes each field once.
+    """
+
+    def __init__(self, path: str, formats: dict, offsets: dict, data=None, field_dir: str = None):
+        self.path = path
+        self.formats = formats
+        self.offsets = offsets
+        self.field_dir = field_dir
+        self._data = _open(path) if data is None else data
+        self._buf = np.frombuffer(self._data, dtype=np.uint8)
+        self._cache = {}
+        self._timeline = None
+        # reentrant: decoding an implicit TimeUS decodes the other types' TimeUS
+        self._lock = threading.RLock()
+
+    @classmethod
+    def build(cls, path: str, progress_callback=None):
+        data = _open(path)
+        formats, offsets = scan_log(data, progress_callback)
+        return cls(path, formats, offsets, data)
+
+    def __getstate__(self):
+        # process pool workers reopen the log instead of receiving the decoded cache
+        return {"path": self.path, "formats": self.formats, "offsets": self.offsets, "field_dir": self.field_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["formats"], state["offsets"], field_dir=state.get("field_dir"))
+
+    def counts(self):
+        return {name: len(offsets) for name, offsets in self.offsets.items()}
+
+    def field_names(self, msg_type: str):
+        names = list(self.formats[msg_type].fields)
+        # types without their own timestamp get one, like parse_log_columns does
+        return names if "TimeUS" in names else names + ["TimeUS"]
+
+    def nbytes(self):
+        """Bytes held by decoded fields."""
+        return sum(values.nbytes for values in self._cache.values())
+
+    def field(self, msg_type: str, field: str):
+        """Every value of one field, decoded on first use."""
+        key = (msg_type, field)
+        values = self._cache.get(key)
+        if values is None:
+            with self._lock:
+                values = self._cache.get(key)
+                if values is None:
+                    values = self._cache[key] = self._load_or_decode(msg_type, field)
+        return values
+
+    def decoded_fields(self):
+        """{(msg_type, field): values} of the fields decoded so far."""
+        return dict(self._cache)
+
+    def columns(self):
+        return LazyColumns(self)
+
+    # --- Decoding ---
+    def _load_or_decode(self, msg_type, field):
+        if self.field_dir is None:
+            return self._decode(msg_type, field, self.offsets[msg_type])
+        path = os.path.join(self.field_dir, field_file(msg_type, field))
+        try:
+            return np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            pass
+        values = self._decode(msg_type, field, self.offsets[msg_type])
+        try:
+            write_field(path, values)
+            return np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            # store pruned or read-only, keep this process's copy
+            return values
+
+    def _gather(self, offsets, start, dtype):
+        size = dtype.itemsize
+        raw = np.empty((len(offsets), size), dtype=np.uint8)
+        span = np.arange(size)
+        for lo in range(0, len(offsets), DECODE_BLOCK_ROWS):
+            block = offsets[lo:lo + DECODE_BLOCK_ROWS] + start
+            raw[lo:lo + len(block)] = self._buf[block[:, None] + span]
+        values = raw.view(dtype.base)
+        return values.reshape(len(offsets)) if dtype.shape == () else values
+
+    def _decode(self, msg_type, field, offsets):
+        fmt = self.formats[msg_type]
+        if field not in fmt.fields:
+            if field == "TimeUS":
+                return self._implicit_time(offsets)
+            raise KeyError(field)
+        pos, dtype, char = fmt.fields[field]
+        values = self._gather(offsets, 3 + pos, dtype)
+        if char in STRING_FORMATS:
+            return np.array([decode_string(v) for v in values])
+        if char == "g":
+            # half floats are widened to float32, as the full parse does
+            return values.astype(np.float32)
+        mult = FORMAT_TO_STRUCT[char][1]
+        if mult is not None:
+            # divide rather than multiply, matching pymavlink's rounding
+            values = values / (1 / mult) if 0.0 < mult < 1.0 else values * mult
+        return values.astype(values.dtype.newbyteorder("="), copy=False)
+
+    def _implicit_time(self, offsets):
+        """TimeUS of the last timestamped message before each offset (0 before the first)."""
+        if self._timeline is None:
+            positions, times = [], []
+            for name, fmt in self.formats.items():
+                if "TimeUS" in fmt.fields:
+                    positions.append(self.offsets[name])
+                    times.append(self.field(name, "TimeUS").astype(np.uint64))
+            positions = np.concatenate(positions or [np.empty(0, dtype=np.int64)])
+            times = np.concatenate(times or [np.empty(0, dtype=np.uint64)])
+            order = np.argsort(positions, kind="stable")
+            self._timeline = positions[order], times[order]
+        positions, times = self._timeline
+        if not len(times):
+            return np.zeros(len(offsets), dtype=np.uint64)
+        previous = np.searchsorted(positions, offsets) - 1
+        return np.where(previous >= 0, times[np.maximum(previous, 0)], 0).astype(np.uint64)
+
+
+class MessageColumns(Mapping):
+    """Fields of one message type, decoded when first read."""
+
+    def __init__(self, index: LogIndex, msg_type: str):
+        self.index = index
+        self.msg_type = msg_type
+        self._names = index.field_names(msg_type)
+
+    def __getitem__(self, field):
+        if field not in self._names:
+            raise KeyError(field)
+        return self.index.field(self.msg_type, field)
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, field):
+        return field in self._names
+
+
+class LazyColumns(Mapping):
+    """
+    Drop-in for the {msg_type: {field: np.ndarray}} dict parse_log_columns
+    returns, backed by a LogIndex. Listing types and fields decodes nothing.
+    """
+
+    def __init__(self, index: LogIndex):
+        self.index = index
+        self._types = {name: MessageColumns(index, name) for name in index.offsets}
+
+    def __getitem__(self, msg_type):
+        return self._types[msg_type]
+
+    def __iter__(self):
+        return iter(self._types)
+
+    def __len__(self):
+        return len(self._types)
+
+    def nbytes(self):
+        return self.index.nbytes()
+
+
+def index_log_file(file_path: str, progress_callback=None):
+    """
+    Index a DataFlash .bin log without decoding it.
+
+    Returns:
+        dict: {"columns": LazyColumns, "summary": {msg_type: count}}, shaped
+            like parse_log_columns' result
+    """
+    index = LogIndex.build(file_path, progress_callback)
+    return {"columns": index.columns(), "summary": index.counts()}
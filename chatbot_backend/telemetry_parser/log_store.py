@@ -0,0 +1,204 @@
+import json
+import os
+import shutil
+import time
+import numpy as np
+from telemetry_parser.log_index import LazyColumns, LogIndex, MessageFormat, field_file, write_field
+
+LOG_STORE_PATH = os.getenv("LOG_STORE_PATH", "cache/logs")
+LOG_STORE_MAX_MB = float(os.getenv("LOG_STORE_MAX_MB", 10240))
+
+# bump when the stored layout or the stored risk result changes shape
+STORE_VERSION = 3
+MANIFEST = "manifest.json"
+LOG_FILE = "log.bin"
+OFFSETS_FILE = "offsets.npy"
+# decoded fields of an indexed log, shared by the processes that load it
+FIELDS_DIR = "fields"
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+class LogStore:
+    """
+    Content-addressed store of parsed logs.
+
+    Each log lives in <root>/<sha256 of the upload>/ with a manifest. A
+    DataFlash log parsed lazily is kept as the log itself plus its message
+    offset index, and is decoded on demand again after loading, each field
+    written to the entry once decoded and memory-mapped from there; a fully
+    decoded log (tlogs) is kept as one .npy file per column and loaded back
+    as memory-mapped arrays. Either way a repeat upload or a restarted
+    server attaches to an existing parse without scanning the log again.
+    Least recently loaded logs are pruned once the store exceeds max_bytes.
+    """
+
+    def __init__(self, root: str = LOG_STORE_PATH, max_bytes: float = LOG_STORE_MAX_MB * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, digest: str):
+        return os.path.join(self.root, digest)
+
+    def has(self, digest: str):
+        """True if a complete entry of the current STORE_VERSION is stored under the digest."""
+        try:
+            with open(os.path.join(self.path(digest), MANIFEST)) as f:
+                return json.load(f).get("version") == STORE_VERSION
+        except (OSError, ValueError):
+            return False
+
+    def save(self, digest: str, parsed_data: dict, risk: dict = None):
+        """Write parsed columns under the digest. Safe against concurrent writers."""
+        final = self.path(digest)
+        staging = f"{final}.tmp-{os.getpid()}-{time.time_ns()}"
+        os.makedirs(staging)
+        try:
+            manifest = {
+                "version": STORE_VERSION,
+                "summary": parsed_data.get("summary", {}),
+                "risk": risk,
+            }
+            if isinstance(parsed_data["columns"], LazyColumns):
+                manifest["index"] = self._save_index(staging, parsed_data["columns"].index)
+            else:
+                manifest["columns"] = self._save_columns(staging, parsed_data["columns"])
+            with open(os.path.join(staging, MANIFEST), "w") as f:
+                json.dump(manifest, f)
+            if os.path.exists(final) and not self.has(digest):
+                # written by an older STORE_VERSION or left incomplete, replace it
+                self._discard(final)
+            os.rename(staging, final)
+        except OSError:
+            # another worker stored the same log first
+            shutil.rmtree(staging, ignore_errors=True)
+            if not self.has(digest):
+                raise
+        self.prune()
+
+    @staticmethod
+    def _discard(path):
+        # renamed aside first so readers never see a half-deleted entry under the digest
+        doomed = f"{path}.stale-{os.getpid()}-{time.time_ns()}"
+        try:
+            os.rename(path, doomed)
+        except OSError:
+            # another writer replaced it first
+            return
+        shutil.rmtree(doomed, ignore_errors=True)
+
+    @staticmethod
+    def _save_columns(staging, columns):
+        names = {}
+        for msg_type, fields in columns.items():
+            names[msg_type] = {}
+            for field, values in fields.items():
+                name = field_file(msg_type, field)
+                np.save(os.path.join(staging, name), values, allow_pickle=values.dtype == object)
+                names[msg_type][field] = name
+        return names
+
+    @staticmethod
+    def _save_index(staging, index: LogIndex):
+        log_file = os.path.join(staging, LOG_FILE)
+        try:
+            # the upload is deleted once parsed, a hard link keeps its data without a copy
+            os.link(index.path, log_file)
+        except OSError:
+            shutil.copyfile(index.path, log_file)
+        ranges, start = {}, 0
+        for msg_type, offsets in index.offsets.items():
+            ranges[msg_type] = [start, start + len(offsets)]
+            start += len(offsets)
+        all_offsets = [index.offsets[msg_type] for msg_type in ranges]
+        np.save(os.path.join(staging, OFFSETS_FILE),
+                np.concatenate(all_offsets) if all_offsets else np.empty(0, dtype=np.int64))
+        # fields decoded by the parse (those risk scoring read) are kept for the server
+        fields = os.path.join(staging, FIELDS_DIR)
+        os.makedirs(fields)
+        for (msg_type, field), values in index.decoded_fields().items():
+            write_field(os.path.join(fields, field_file(msg_type, field)), values)
+        return {
+            "formats": {msg_type: fmt.to_dict() for msg_type, fmt in index.formats.items()},
+            "ranges": ranges,
+        }
+
+    def load(self, digest: str):
+        """
+        Returns:
+            tuple: (parsed data with lazily decoded or memory-mapped columns, stored risk result) or None
+        """
+        path = self.path(digest)
+        try:
+            with open(os.path.join(path, MANIFEST)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("version") != STORE_VERSION:
+            return None
+        try:
+            if "index" in manifest:
+                columns = self._load_index(path, manifest["index"])
+            else:
+                columns = self._load_columns(path, manifest["columns"])
+        except (OSError, ValueError):
+            # pruned or partially deleted while we were reading
+            return None
+        os.utime(os.path.join(path, MANIFEST))
+        return {"columns": columns, "summary": manifest["summary"]}, manifest.get("risk")
+
+    @staticmethod
+    def _load_index(path, stored):
+        offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+        fields = os.path.join(path, FIELDS_DIR)
+        index = LogIndex(
+            os.path.join(path, LOG_FILE),
+            {msg_type: MessageFormat.from_dict(fmt) for msg_type, fmt in stored["formats"].items()},
+            {msg_type: offsets[lo:hi] for msg_type, (lo, hi) in stored["ranges"].items()},
+            # entries written before decoded fields were stored keep them in memory
+            field_dir=fields if os.path.isdir(fields) else None,
+        )
+        return index.columns()
+
+    @staticmethod
+    def _load_columns(path, stored):
+        columns = {}
+        for msg_type, fields in stored.items():
+            columns[msg_type] = {}
+            for field, name in fields.items():
+                file = os.path.join(path, name)
+                try:
+                    columns[msg_type][field] = np.load(file, mmap_mode="r")
+                except ValueError:
+                    # object columns are pickled and cannot be memory-mapped
+                    columns[msg_type][field] = np.load(file, allow_pickle=True)
+        return columns
+
+    def index_paths(self, digest: str, key: str):
+        base = os.path.join(self.path(digest), f"index-{key}")
+        return base + ".faiss", base + ".json"
+
+    def prune(self):
+        """Delete least recently used logs until the store fits in max_bytes."""
+        entries = []
+        for digest in os.listdir(self.root):
+            manifest = os.path.join(self.path(digest), MANIFEST)
+            if os.path.exists(manifest):
+                entries.append((os.path.getmtime(manifest), digest, _dir_size(self.path(digest))))
+        used = sum(size for _, _, size in entries)
+        for _, digest, size in sorted(entries):
+            if used <= self.max_bytes:
+                break
+            # open memory maps stay valid after the files are unlinked
+            shutil.rmtree(self.path(digest), ignore_errors=True)
+            used -= size
@@ -1,40 +1,226 @@
 from pymavlink import mavutil
-from collections import defaultdict
+import array
+import numpy as np
+from telemetry_parser.log_index import STRING_FORMATS, decode_string, index_log_file, is_dataflash
 
+# DataFlash format characters -> array.array typecode for the raw unpacked
+# value. Multipliers (c, C, e, E, L) are applied once per column at the end.
+FORMAT_TYPECODES = {
+    "b": "b", "B": "B", "h": "h", "H": "H", "i": "i", "I": "I",
+    "q": "q", "Q": "Q", "M": "b", "f": "f", "g": "f", "d": "d",
+    "c": "h", "C": "H", "e": "i", "E": "I", "L": "i",
+}
+PROGRESS_INTERVAL = 20000  # messages between progress callbacks
 
-def parse_log_file(file_path: str, max_samples: int = 100):
+
+def _new_column(typecode):
+    return array.array(typecode) if typecode else []
+
+
+def _append(cols, i, value):
+    try:
+        cols[i].append(value)
+    except (TypeError, OverflowError):
+        # Value does not fit the typed array (None, nan in an int field, ...)
+        cols[i] = list(cols[i])
+        cols[i].append(value)
+
+
+def _to_array(col):
+    if isinstance(col, array.array):
+        return np.frombuffer(col, dtype=col.typecode) if len(col) else np.array([], dtype=col.typecode)
+    try:
+        return np.array(col)
+    except ValueError:
+        return np.array(col, dtype=object)
+
+
+class _ColumnBuilder:
+    """Accumulates the values of one message type in typed arrays."""
+
+    def __init__(self, msg):
+        self.fmt = getattr(msg, "fmt", None)
+        if self.fmt is not None:
+            # DataFlash: take the raw struct values and scale them later
+            self.fields = list(self.fmt.columns)
+            self.cols = [_new_column(FORMAT_TYPECODES.get(c)) for c in self.fmt.format[:len(self.fields)]]
+        else:
+            # MAVLink (tlog) messages carry no format string, infer from the values
+            entry = msg.to_dict()
+            entry.pop("mavpackettype", None)
+            self.fields = list(entry)
+            self.cols = [_new_column(self._infer_typecode(v)) for v in entry.values()]
+        self.has_time = "TimeUS" in self.fields
+        self.time = array.array("Q")
+
+    @staticmethod
+    def _infer_typecode(value):
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, int):
+            return "q"
+        if isinstance(value, float):
+            return "d"
+        return None
+
+    def add(self, msg, time_us):
+        if self.fmt is not None:
+            values = msg._elements
+            if len(values) != len(self.cols):
+                return
+        else:
+            entry = msg.to_dict()
+            values = [entry.get(f) for f in self.fields]
+        cols = self.cols
+        for i, value in enumerate(values):
+            _append(cols, i, value)
+        if not self.has_time:
+            self.time.append(time_us)
+
+    def finish(self):
+        columns = {}
+        for i, field in enumerate(self.fields):
+            arr = _to_array(self.cols[i])
+            if self.fmt is not None:
+                fmt_char = self.fmt.format[i]
+                mult = self.fmt.msg_mults[i]
+                if fmt_char in STRING_FORMATS:
+                    arr = _to_array([decode_string(v) for v in self.cols[i]])
+                elif mult is not None:
+                    # divide rather than multiply, matching pymavlink's rounding
+                    arr = arr / (1 / mult) if 0.0 < mult < 1.0 else arr * mult
+            columns[field] = arr
+        if not self.has_time:
+            columns["TimeUS"] = _to_array(self.time)
+        return columns
+
+
+def _bytes_read(mav):
+    if hasattr(mav, "offset"):
+        return mav.offset
+    f = getattr(mav, "f", None)
+    return f.tell() if f is not None else 0
+
+
+def parse_log_columns(file_path: str, progress_callback=None):
     """
-    Parse a .bin log file and extract structured telemetry data.
+    Decode every message of a .bin log into one NumPy array per field.
 
     Args:
         file_path (str): Path to the .bin file
-        max_samples (int): Max number of entries per message type to extract
+        progress_callback (callable): Called as progress_callback(bytes_decoded, messages_decoded)
+            every PROGRESS_INTERVAL messages and once at the end
 
     Returns:
-        dict: Parsed and structured flight data
+        dict: {"columns": {msg_type: {field: np.ndarray}}, "summary": {msg_type: count}}.
+            Every message type has a "TimeUS" vector; types that do not log it
+            reuse the last TimeUS seen (or the message timestamp for tlogs).
     """
     mav = mavutil.mavlink_connection(file_path)
-    data = defaultdict(list)
-    counts = defaultdict(int)
+    builders = {}
+    last_time_us = 0
+    decoded = 0
 
     while True:
         msg = mav.recv_match(blocking=False)
         if msg is None:
             break
 
+        decoded += 1
+        if progress_callback is not None and decoded % PROGRESS_INTERVAL == 0:
+            progress_callback(_bytes_read(mav), decoded)
+
         msg_type = msg.get_type()
         if msg_type == 'BAD_DATA':
             continue
 
-        if counts[msg_type] < max_samples:
-            try:
-                entry = msg.to_dict()
-                data[msg_type].append(entry)
-                counts[msg_type] += 1
-            except Exception as e:
-                continue
-    # print(data)
+        builder = builders.get(msg_type)
+        try:
+            if builder is None:
+                builder = builders[msg_type] = _ColumnBuilder(msg)
+            if builder.has_time:
+                last_time_us = msg.TimeUS
+            elif builder.fmt is None:
+                last_time_us = int(getattr(msg, "_timestamp", 0) * 1e6)
+            builder.add(msg, last_time_us)
+        except Exception:
+            continue
+
+    if progress_callback is not None:
+        progress_callback(_bytes_read(mav), decoded)
+    columns = {msg_type: builder.finish() for msg_type, builder in builders.items()}
+    return {
+        "columns": columns,
+        "summary": {k: len(v["TimeUS"]) for k, v in columns.items()}
+    }
+
+
+def to_message_dicts(columns: dict, max_samples: int = None):
+    """
+    Rebuild the legacy {msg_type: [message dict, ...]} view from columnar data.
+
+    Args:
+        columns (dict): {msg_type: {field: np.ndarray}} as returned by parse_log_columns
+        max_samples (int): Max number of entries per message type, None for all
+
+    Returns:
+        dict: msg_type -> list of dicts shaped like pymavlink's to_dict()
+    """
+    messages = {}
+    for msg_type, fields in columns.items():
+        names = list(fields)
+        values = [fields[name][:max_samples].tolist() for name in names]
+        messages[msg_type] = [
+            {"mavpackettype": msg_type, **dict(zip(names, row))} for row in zip(*values)
+        ]
+    return messages
+
+
+def columns_from_messages(messages: dict):
+    """Convert a legacy {msg_type: [message dict, ...]} view into columns."""
+    columns = {}
+    for msg_type, entries in messages.items():
+        fields = []
+        for entry in entries:
+            fields.extend(k for k in entry if k not in fields and k != "mavpackettype")
+        columns[msg_type] = {f: _to_array([e.get(f) for e in entries]) for f in fields}
+    return columns
+
+
+def get_columns(parsed_data: dict):
+    """Return the columnar view of parsed data from either parse mode."""
+    if "columns" in parsed_data:
+        return parsed_data["columns"]
+    return columns_from_messages(parsed_data.get("messages", {}))
+
+
+def parse_log_file(file_path: str, max_samples: int = 100, columnar: bool = False,
+                   progress_callback=None, lazy: bool = True):
+    """
+    Parse a .bin log file and extract structured telemetry data.
+
+    Args:
+        file_path (str): Path to the .bin file
+        max_samples (int): Max number of entries per message type to extract
+            (ignored in columnar mode, which keeps every sample)
+        columnar (bool): Return full-resolution NumPy columns instead of dicts
+        progress_callback (callable): See parse_log_columns
+        lazy (bool): Index DataFlash logs and decode fields when first read
+            (see telemetry_parser.log_index) instead of decoding every message
+            up front. Telemetry logs (.tlog) are always decoded in full.
+
+    Returns:
+        dict: Parsed and structured flight data
+    """
+    if lazy and is_dataflash(file_path):
+        parsed = index_log_file(file_path, progress_callback)
+    else:
+        parsed = parse_log_columns(file_path, progress_callback)
+    if columnar:
+        return parsed
+
+    data = to_message_dicts(parsed["columns"], max_samples)
     return {
-        "messages": dict(data),
+        "messages": data,
         "summary": {k: len(v) for k, v in data.items()}
-    }
\ No newline at end of file
+    }